@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def test_settings():
+    """Настройки тестов из core.testing и для прогона через pytest."""
+    from core.testing import test_settings
+
+    with test_settings():
+        yield
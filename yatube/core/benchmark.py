@@ -0,0 +1,155 @@
+"""Микробенчмарки с сохранёнными базовыми замерами.
+
+Каждый замер — несколько раундов по `number` вызовов, значение раунда —
+среднее время вызова. Подготовка перед вызовом (`setup`) в замер не
+входит, сборщик мусора на время раунда отключается, как в `timeit`.
+
+Сравнение с базовой линией учитывает шум: замедлением считается рост
+медианы больше чем на `threshold` при значимом сдвиге всего
+распределения по одностороннему критерию Манна — Уитни. Один медленный
+раунд из-за соседнего процесса так регрессией не станет.
+"""
+import gc
+import math
+import platform
+import time
+from collections import namedtuple
+
+import django
+
+Benchmark = namedtuple('Benchmark', 'name func setup')
+Benchmark.__new__.__defaults__ = (None,)
+
+SLOWER = 'slower'
+FASTER = 'faster'
+SAME = 'same'
+NEW = 'new'
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def call_time(benchmark):
+    if benchmark.setup is not None:
+        benchmark.setup()
+    started = time.perf_counter()
+    benchmark.func()
+    return time.perf_counter() - started
+
+
+def calibrate(benchmark, min_time):
+    """Число вызовов на раунд, чтобы раунд шёл не меньше `min_time`."""
+    elapsed = call_time(benchmark)
+    return max(1, math.ceil(min_time / max(elapsed, 1e-9)))
+
+
+def measure_round(benchmark, number):
+    gc.collect()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return sum(call_time(benchmark) for _ in range(number)) / number
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def run(benchmarks, repeat=15, min_time=0.05):
+    """Замеры набора: {имя: {'median': с, 'samples': [...]}}.
+
+    Раунды разных бенчмарков чередуются: если машину на время чем-то
+    заняли, это размажется по всем замерам, а не исказит один.
+    """
+    # Калибровочный вызов заодно прогревает кэши шаблонов и импортов.
+    numbers = [calibrate(benchmark, min_time) for benchmark in benchmarks]
+    samples = [[] for _ in benchmarks]
+    for _ in range(repeat):
+        for benchmark, number, values in zip(benchmarks, numbers, samples):
+            values.append(measure_round(benchmark, number))
+    return {
+        benchmark.name: {'median': median(values), 'samples': values}
+        for benchmark, values in zip(benchmarks, samples)
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+
+def mann_whitney_greater(first, second):
+    """p-значение гипотезы, что `first` в целом больше `second`.
+
+    Нормальное приближение статистики U с поправкой на связки; для
+    пятнадцати и больше раундов на каждую сторону его достаточно.
+    """
+    n1, n2 = len(first), len(second)
+    if not n1 or not n2:
+        return 1.0
+    values = sorted(
+        [(value, 0) for value in first] + [(value, 1) for value in second]
+    )
+    ranks = [0.0] * len(values)
+    ties = 0
+    start = 0
+    while start < len(values):
+        end = start
+        while (
+            end + 1 < len(values) and values[end + 1][0] == values[start][0]
+        ):
+            end += 1
+        for position in range(start, end + 1):
+            ranks[position] = (start + end) / 2 + 1
+        size = end - start + 1
+        ties += size ** 3 - size
+        start = end + 1
+    rank_sum = sum(
+        rank for rank, (_, side) in zip(ranks, values) if side == 0
+    )
+    u = rank_sum - n1 * (n1 + 1) / 2
+    total = n1 + n2
+    variance = n1 * n2 / 12 * (total + 1 - ties / (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(baseline, current, threshold=0.2, alpha=0.01):
+    """Строки сравнения замеров с базовыми, по имени.
+
+    Каждая строка: имя, медианы, относительное изменение, p-значение и
+    вывод `SLOWER`, `FASTER`, `SAME` или `NEW` (базового замера нет).
+    """
+    rows = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        row = {
+            'name': name,
+            'baseline': base and base['median'],
+            'current': result['median'],
+            'change': None,
+            'p_value': None,
+            'status': NEW,
+        }
+        if base is not None:
+            row['change'] = result['median'] / base['median'] - 1
+            slower = mann_whitney_greater(result['samples'], base['samples'])
+            faster = mann_whitney_greater(base['samples'], result['samples'])
+            if row['change'] > threshold and slower < alpha:
+                row['status'], row['p_value'] = SLOWER, slower
+            elif row['change'] < -threshold and faster < alpha:
+                row['status'], row['p_value'] = FASTER, faster
+            else:
+                row['status'], row['p_value'] = SAME, min(slower, faster)
+        rows.append(row)
+    return rows
@@ -0,0 +1,309 @@
+"""Общий для всех процессов кэш в файле SQLite.
+
+В отличие от LocMemCache, копия одна на все WSGI-процессы, размер
+ограничивается в байтах, а при переполнении вытесняются давно не
+читавшиеся записи (LRU). Счётчики попаданий, промахов и вытеснений
+копятся в процессе и периодически сбрасываются в таблицу статистики.
+
+Суммарный размер значений ведут триггеры в той же таблице статистики,
+поэтому запись не пересчитывает всю таблицу: просроченные и давно не
+читавшиеся записи ищутся по индексам, только когда предел превышен.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL,'
+    ' size INTEGER NOT NULL, accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    'CREATE TABLE IF NOT EXISTS stats ('
+    ' name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    'CREATE TRIGGER IF NOT EXISTS cache_inserted AFTER INSERT ON cache BEGIN'
+    " UPDATE stats SET value = value + new.size WHERE name = 'bytes'; END",
+    'CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache BEGIN'
+    " UPDATE stats SET value = value - old.size WHERE name = 'bytes'; END",
+    'CREATE TRIGGER IF NOT EXISTS cache_resized AFTER UPDATE OF size ON cache'
+    ' BEGIN UPDATE stats SET value = value + new.size - old.size'
+    " WHERE name = 'bytes'; END",
+)
+COUNTERS = ('hits', 'misses', 'evictions', 'sets')
+# Строка статистики с суммарным размером значений, её ведут триггеры.
+TOTAL = 'bytes'
+
+
+class SQLiteCache(BaseCache):
+    """Кэш-бэкенд на SQLite с вытеснением LRU по объёму.
+
+    Параметры OPTIONS: MAX_BYTES — предел суммарного размера значений,
+    TOUCH_INTERVAL — как часто (в секундах) обновлять время чтения
+    записи, FLUSH_INTERVAL — как часто сбрасывать счётчики в базу.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.max_bytes = int(options.get('MAX_BYTES', 64 * 1024 * 1024))
+        self.touch_interval = options.get('TOUCH_INTERVAL', 1)
+        self.flush_interval = options.get('FLUSH_INTERVAL', 5)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._flushed = time.monotonic()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('BEGIN IMMEDIATE')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            if connection.execute(
+                'SELECT 1 FROM stats WHERE name = ?', (TOTAL,)
+            ).fetchone() is None:
+                # Файл от версии без триггеров: один раз считаем сумму.
+                connection.execute(
+                    'INSERT INTO stats (name, value) '
+                    'SELECT ?, COALESCE(SUM(size), 0) FROM cache', (TOTAL,)
+                )
+            connection.execute('COMMIT')
+            self._local.connection = connection
+        return connection
+
+    def _total(self):
+        return self.connection.execute(
+            'SELECT value FROM stats WHERE name = ?', (TOTAL,)
+        ).fetchone()[0]
+
+    def _count(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                self._counters[name] += value
+            due = time.monotonic() - self._flushed >= self.flush_interval
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Переносит накопленные в процессе счётчики в базу."""
+        with self._lock:
+            counters = self._counters
+            self._counters = dict.fromkeys(COUNTERS, 0)
+            self._flushed = time.monotonic()
+        self.connection.executemany(
+            'INSERT INTO stats (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            [(name, value) for name, value in counters.items() if value],
+        )
+
+    def stats(self):
+        """Счётчики, число записей и занятый объём."""
+        self.flush_stats()
+        result = dict.fromkeys(COUNTERS, 0)
+        result.update(self.connection.execute(
+            'SELECT name, value FROM stats'
+        ).fetchall())
+        result['entries'] = self.connection.execute(
+            'SELECT COUNT(*) FROM cache'
+        ).fetchone()[0]
+        result['max_bytes'] = self.max_bytes
+        return result
+
+    def reset_stats(self):
+        with self._lock:
+            self._counters = dict.fromkeys(COUNTERS, 0)
+        self.connection.execute('DELETE FROM stats WHERE name != ?', (TOTAL,))
+
+    def _fetch(self, keys):
+        now = time.time()
+        rows = self.connection.execute(
+            'SELECT key, value, expires, accessed FROM cache '
+            f'WHERE key IN ({", ".join("?" * len(keys))})',
+            keys,
+        ).fetchall()
+        found, touched = {}, []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                continue
+            found[key] = pickle.loads(value)
+            if now - accessed >= self.touch_interval:
+                touched.append((now, key))
+        if touched:
+            self.connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', touched
+            )
+        self._count(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def _store(self, items, timeout, only_new=False):
+        """Записывает пары и вытесняет старые записи сверх предела."""
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in items:
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            rows.append((key, blob, expires, len(blob), now))
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if only_new:
+                connection.execute(
+                    'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                    (rows[0][0], now),
+                )
+                stored = connection.execute(
+                    'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?, ?)',
+                    rows[0],
+                ).rowcount
+            else:
+                # Не REPLACE: удаление при замене не запускает триггер.
+                connection.executemany(
+                    'INSERT INTO cache VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET value = excluded.value, '
+                    'expires = excluded.expires, size = excluded.size, '
+                    'accessed = excluded.accessed',
+                    rows,
+                )
+                stored = len(rows)
+            evicted = self._evict(now) if stored else 0
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._count(sets=stored, evictions=evicted)
+        return bool(stored)
+
+    def _evict(self, now):
+        if self._total() <= self.max_bytes:
+            return 0
+        connection = self.connection
+        evicted = connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (now,)
+        ).rowcount
+        excess = self._total() - self.max_bytes
+        if excess <= 0:
+            return evicted
+        victims = []
+        for key, size in connection.execute(
+            'SELECT key, size FROM cache ORDER BY accessed'
+        ):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany('DELETE FROM cache WHERE key = ?', victims)
+        return evicted + len(victims)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._store([(key, value)], timeout, only_new=True)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        if not keys:
+            return {}
+        keys_map = {self.make_key(key, version=version): key for key in keys}
+        for key in keys_map:
+            self.validate_key(key)
+        found = self._fetch(list(keys_map))
+        return {keys_map[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._store([(key, value)], timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if data:
+            items = []
+            for key, value in data.items():
+                key = self.make_key(key, version=version)
+                self.validate_key(key)
+                items.append((key, value))
+            self._store(items, timeout)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        ).rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно увеличивает число под блокировкой записи SQLite."""
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (blob, len(blob), key),
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return value
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self.connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        self.connection.executemany(
+            'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+        )
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт весь поток: открывать файл на каждый запрос
+        # дороже, чем держать его.
+        pass
@@ -0,0 +1,249 @@
+"""Потоковая загрузка больших выгрузок `dumpdata`.
+
+`loaddata` читает файл целиком и сохраняет объекты по одному через
+`save()`. Здесь записи читаются из файла по частям: поддерживаются и
+JSON-массив `dumpdata`, и NDJSON (по записи в строке), в том числе
+сжатые gzip. Записи копятся по моделям и сохраняются пачками через
+`bulk_create`; перед пачкой модели сохраняются накопленные пачки
+моделей, на которые она ссылается, так что пользователи попадают в базу
+раньше постов, а посты — раньше комментариев и подписок.
+
+`bulk_create` не отправляет сигналы моделей, поэтому производные данные
+(счётчики, ленты, индексы) после загрузки пересчитывают отдельно. Даты
+полей `auto_now` и `auto_now_add` берутся из выгрузки, как в `loaddata`;
+текущее время получают только те, которых в выгрузке нет.
+"""
+import gzip
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer
+from django.db import connection, transaction
+from django.utils import timezone
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = ' \t\n\r'
+
+
+def open_dump(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+class Buffer:
+    """Окно чтения файла: дочитывается, пока значение не поместится."""
+
+    decoder = json.JSONDecoder()
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.text, self.position, self.eof = '', 0, False
+
+    def read(self):
+        chunk = self.file.read(self.chunk_size)
+        self.text = self.text[self.position:] + chunk
+        self.position, self.eof = 0, not chunk
+
+    def peek(self, skip):
+        """Следующий символ после пропуска `skip`; пустой в конце файла."""
+        while True:
+            while (
+                self.position < len(self.text)
+                and self.text[self.position] in skip
+            ):
+                self.position += 1
+            if self.position < len(self.text) or self.eof:
+                return self.text[self.position:self.position + 1]
+            self.read()
+
+    def decode(self):
+        while True:
+            try:
+                value, self.position = self.decoder.raw_decode(
+                    self.text, self.position
+                )
+                return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.read()
+
+
+def records(file, chunk_size=CHUNK_SIZE):
+    """Записи JSON-массива или NDJSON по одной, без чтения файла целиком."""
+    buffer = Buffer(file, chunk_size)
+    in_array = buffer.peek(WHITESPACE) == '['
+    buffer.position += in_array
+    separators = WHITESPACE + ',' if in_array else WHITESPACE
+    while True:
+        char = buffer.peek(separators)
+        if in_array and char == ']':
+            return
+        if not char:
+            if in_array:
+                raise ValueError('Массив записей не закрыт')
+            return
+        yield buffer.decode()
+
+
+def dependencies(model):
+    """Модели, на которые ссылаются внешние ключи `model`."""
+    return {
+        field.related_model for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model is not model
+    }
+
+
+def automatic_dates(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+
+
+@contextmanager
+def dumped_dates(model, objects):
+    """Сохраняет даты `auto_now`/`auto_now_add` такими, как в выгрузке.
+
+    `bulk_create` вызывает `pre_save(add=True)`, и эти поля получили бы
+    время загрузки; `loaddata` сохраняет объекты с `raw=True` и их не
+    трогает. На время вставки флаги полей выключаются, пустым полям
+    проставляется текущее время, как это сделал бы `pre_save`.
+    """
+    fields = automatic_dates(model)
+    now = timezone.now()
+    for field in fields:
+        for obj in objects:
+            if getattr(obj, field.attname) is None:
+                setattr(obj, field.attname, now)
+    flags = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Loader:
+    """Копит объекты по моделям и сохраняет их пачками.
+
+    `progress(model, processed)` вызывается после каждой пачки с числом
+    уже обработанных объектов модели. С `ignore_conflicts` база молча
+    пропускает записи с занятым ключом, поэтому добавленные строки
+    (`inserted`) считаются по таблицам до и после загрузки.
+    """
+
+    def __init__(self, batch_size=5000, ignore_conflicts=False,
+                 exclude=(), progress=None):
+        self.batch_size = batch_size
+        self.ignore_conflicts = ignore_conflicts
+        self.exclude = set(exclude)
+        self.progress = progress
+        self.pending = defaultdict(list)
+        self.relations = defaultdict(list)
+        self.processed = defaultdict(int)
+        self.existing = {}
+        self.inserted = 0
+        self.skipped = 0
+
+    def excluded(self, label):
+        return label in self.exclude or label.split('.')[0] in self.exclude
+
+    def wanted(self, stream):
+        for record in stream:
+            if self.excluded(record['model'].lower()):
+                self.skipped += 1
+                continue
+            yield record
+
+    def load(self, stream):
+        """Загружает записи в одной транзакции, как `loaddata`.
+
+        Проверка внешних ключей отложена до конца загрузки: записи могут
+        ссылаться на объекты, которые встретятся в файле позже.
+        """
+        started = time.monotonic()
+        with transaction.atomic():
+            with connection.constraint_checks_disabled():
+                for item in Deserializer(
+                    self.wanted(stream), ignorenonexistent=True
+                ):
+                    self.add(item)
+                self.flush_all()
+            self.inserted = self.count_inserted()
+            models = list(self.processed)
+            connection.check_constraints(
+                table_names=[model._meta.db_table for model in models]
+            )
+            self.reset_sequences(models)
+        return time.monotonic() - started
+
+    def add(self, item):
+        model = type(item.object)
+        self.pending[model].append(item.object)
+        for name, values in (item.m2m_data or {}).items():
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = f'{field.m2m_field_name()}_id'
+            target = f'{field.m2m_reverse_field_name()}_id'
+            self.relations[through].extend(
+                through(**{source: item.object.pk, target: value})
+                for value in values
+            )
+        if len(self.pending[model]) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model, seen=None):
+        seen = seen or set()
+        seen.add(model)
+        for related in dependencies(model) - seen:
+            if self.pending[related]:
+                self.flush(related, seen)
+        objects, self.pending[model] = self.pending[model], []
+        if not objects:
+            return
+        self.save(model, objects)
+        for through in list(self.relations):
+            if dependencies(through) & {model} and all(
+                not self.pending[related] for related in dependencies(through)
+            ):
+                self.save(through, self.relations.pop(through))
+
+    def flush_all(self):
+        for model in list(self.pending):
+            self.flush(model)
+        for through in list(self.relations):
+            self.save(through, self.relations.pop(through))
+
+    def save(self, model, objects):
+        if self.ignore_conflicts and model not in self.existing:
+            self.existing[model] = model.objects.count()
+        with dumped_dates(model, objects):
+            model.objects.bulk_create(
+                objects, ignore_conflicts=self.ignore_conflicts
+            )
+        self.processed[model] += len(objects)
+        if self.progress is not None:
+            self.progress(model, self.processed[model])
+
+    def count_inserted(self):
+        return sum(
+            model.objects.count() - self.existing[model]
+            if model in self.existing else processed
+            for model, processed in self.processed.items()
+        )
+
+    def reset_sequences(self, models):
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
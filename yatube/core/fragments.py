@@ -0,0 +1,58 @@
+"""Персональные фрагменты страниц, общих для всех пользователей.
+
+Страница ленты кэшируется одной копией для всех: вместо шапки, кнопки
+подписки и других зависящих от пользователя кусков в неё выводятся
+метки. Перед отдачей метки заменяются фрагментами, отрисованными для
+текущего запроса.
+"""
+import base64
+import json
+import re
+
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+PLACEHOLDER = '<!--personal:{}-->'
+PLACEHOLDER_RE = re.compile(r'<!--personal:([A-Za-z0-9_=-]+)-->')
+
+
+def defer(request):
+    """Откладывает персональные фрагменты до второго прохода."""
+    request.personal_deferred = True
+
+
+def is_deferred(request):
+    return getattr(request, 'personal_deferred', False)
+
+
+def render_fragment(request, template_name, params):
+    return render_to_string(template_name, params, request=request)
+
+
+def placeholder(template_name, params):
+    payload = json.dumps([template_name, params], separators=(',', ':'))
+    token = base64.urlsafe_b64encode(payload.encode()).decode()
+    return mark_safe(PLACEHOLDER.format(token))
+
+
+def fill(request, content):
+    """Подставляет фрагменты текущего пользователя вместо меток."""
+    def render(match):
+        payload = base64.urlsafe_b64decode(match.group(1)).decode()
+        template_name, params = json.loads(payload)
+        return render_fragment(request, template_name, params)
+    return PLACEHOLDER_RE.sub(render, content)
+
+
+def personalize(request, response):
+    """Копия общего ответа с фрагментами для текущего запроса.
+
+    Куки переносятся вместе с заголовками: их мог выставить сам view.
+    """
+    content = fill(request, response.content.decode(response.charset))
+    personal = HttpResponse(content, status=response.status_code)
+    for header, value in response.items():
+        personal[header] = value
+    personal.cookies.update(response.cookies)
+    return personal
@@ -0,0 +1,279 @@
+"""Нагрузочный прогон WSGI-приложения в том же процессе.
+
+Виртуальные пользователи вызывают `yatube.wsgi.application` напрямую,
+без сети и HTTP-сервера: замеряется только работа приложения и базы.
+Каждый исполнитель (поток или процесс) в цикле до конца прогона
+выполняет сценарии и записывает по каждому запросу имя view, задержку,
+число SQL-запросов и код ответа. Итог — перцентили задержки, запросы в
+секунду и число SQL-запросов по каждому имени view.
+
+Потоки делят один GIL, поэтому показывают задержки при конкуренции за
+базу и кэш; пропускную способность нескольких воркеров сервера точнее
+меряют процессы.
+"""
+import math
+import multiprocessing
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from importlib import import_module
+from io import BytesIO
+from urllib.parse import unquote, unquote_to_bytes, urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY,
+)
+from django.db import connection, connections
+from django.urls import Resolver404, resolve
+
+from .queries import record_queries
+
+PERCENTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+
+def percentile(values, fraction):
+    """Перцентиль по ближайшему рангу из отсортированного списка."""
+    if not values:
+        return None
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def view_name(path):
+    try:
+        return resolve(path).view_name
+    except Resolver404:
+        return path
+
+
+class Recorder:
+    """Замеры по имени view; записи исполнителей сливаются в одну."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def add(self, name, latency, queries, status):
+        self.latencies[name].append(latency)
+        self.queries[name].append(queries)
+        self.statuses[name][status] += 1
+
+    def merge(self, other):
+        for name, latencies in other.latencies.items():
+            self.latencies[name].extend(latencies)
+            self.queries[name].extend(other.queries[name])
+            self.statuses[name].update(other.statuses[name])
+
+    def endpoint(self, name, duration):
+        latencies = sorted(self.latencies[name])
+        queries = self.queries[name]
+        statuses = self.statuses[name]
+        return {
+            'requests': len(latencies),
+            'errors': sum(
+                count for status, count in statuses.items() if status >= 400
+            ),
+            'rps': round(len(latencies) / duration, 2),
+            'latency_ms': {
+                **{
+                    label: round(percentile(latencies, fraction) * 1000, 2)
+                    for label, fraction in PERCENTILES
+                },
+                'mean': round(sum(latencies) / len(latencies) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2),
+            },
+            'queries': {
+                'mean': round(sum(queries) / len(queries), 2),
+                'max': max(queries),
+            },
+            'statuses': {
+                str(status): count
+                for status, count in sorted(statuses.items())
+            },
+        }
+
+    def report(self, duration):
+        endpoints = {
+            name: self.endpoint(name, duration)
+            for name in sorted(self.latencies)
+        }
+        requests = sum(item['requests'] for item in endpoints.values())
+        return {
+            'duration': round(duration, 3),
+            'requests': requests,
+            'errors': sum(item['errors'] for item in endpoints.values()),
+            'rps': round(requests / duration, 2) if duration else None,
+            'endpoints': endpoints,
+        }
+
+
+class Client:
+    """Виртуальный пользователь: свои cookie, запросы прямо в WSGI."""
+
+    def __init__(self, application, recorder, multiprocess=False):
+        self.application = application
+        self.recorder = recorder
+        self.multiprocess = multiprocess
+        self.cookies = {}
+
+    def login(self, user):
+        """Входит под пользователем, создавая сессию напрямую.
+
+        Пароль не нужен, поэтому годятся и пользователи без пароля,
+        например из `generate_data`.
+        """
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        self.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def environ(self, method, url, body, content_type):
+        parts = urlsplit(url)
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': unquote_to_bytes(parts.path).decode('iso-8859-1'),
+            'QUERY_STRING': parts.query,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            # Не из INTERNAL_IPS: панель отладки замерялась бы вместе со
+            # страницей.
+            'REMOTE_ADDR': '192.0.2.1',
+            'HTTP_HOST': 'testserver',
+            'HTTP_COOKIE': '; '.join(
+                f'{key}={value}' for key, value in self.cookies.items()
+            ),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': not self.multiprocess,
+            'wsgi.multiprocess': self.multiprocess,
+            'wsgi.run_once': False,
+        }
+        if content_type:
+            environ['CONTENT_TYPE'] = content_type
+        if method == 'POST' and 'csrftoken' in self.cookies:
+            environ['HTTP_X_CSRFTOKEN'] = self.cookies['csrftoken']
+        return environ
+
+    def remember(self, headers):
+        for header, value in headers:
+            if header.lower() != 'set-cookie':
+                continue
+            for key, morsel in SimpleCookie(value).items():
+                if morsel.value and morsel['max-age'] != '0':
+                    self.cookies[key] = morsel.value
+                else:
+                    self.cookies.pop(key, None)
+
+    def request(self, method, url, data=None):
+        """Выполняет запрос и возвращает (код ответа, заголовки, тело)."""
+        body, content_type = b'', None
+        if data is not None:
+            body = urlencode(data).encode()
+            content_type = 'application/x-www-form-urlencoded'
+        environ = self.environ(method, url, body, content_type)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        begin = time.perf_counter()
+        with record_queries() as log:
+            result = self.application(environ, start_response)
+            try:
+                content = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        latency = time.perf_counter() - begin
+        self.remember(started['headers'])
+        self.recorder.add(
+            view_name(unquote(urlsplit(url).path)), latency, len(log),
+            started['status'],
+        )
+        return started['status'], started['headers'], content
+
+    def get(self, url):
+        return self.request('GET', url)
+
+    def post(self, url, data):
+        return self.request('POST', url, data)
+
+
+def work(application, worker, deadline, multiprocess=False):
+    """Гоняет сценарии исполнителя `worker` до `deadline` (perf_counter).
+
+    `worker` вызывается с клиентом для записи замеров и крутит свой цикл
+    сам; возвращает `Recorder` с замерами.
+    """
+    recorder = Recorder()
+    try:
+        worker(lambda: Client(application, recorder, multiprocess), deadline)
+    finally:
+        connection.close()
+    return recorder
+
+
+# Задание для дочерних процессов: они получают его при fork, так что
+# приложение и сценарии не нужно сериализовать.
+_jobs = None
+
+
+def _process_work(number):
+    application, workers, deadline = _jobs
+    return work(application, workers[number], deadline, multiprocess=True)
+
+
+def run(application, workers, duration, processes=False):
+    """Запускает исполнителей `workers` на `duration` секунд.
+
+    Один исполнитель работает в текущем потоке, несколько — в потоках
+    или, с `processes`, в дочерних процессах (fork). Возвращает отчёт
+    `Recorder.report`.
+    """
+    recorder = Recorder()
+    started = time.perf_counter()
+    deadline = started + duration
+    if len(workers) == 1:
+        recorder.merge(work(application, workers[0], deadline))
+    elif processes:
+        global _jobs
+        _jobs = application, workers, deadline
+        # Дочерние процессы не должны делить соединения родителя.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        try:
+            with context.Pool(len(workers)) as pool:
+                for result in pool.map(_process_work, range(len(workers))):
+                    recorder.merge(result)
+        finally:
+            _jobs = None
+    else:
+        results = [None] * len(workers)
+
+        def target(number):
+            results[number] = work(application, workers[number], deadline)
+
+        threads = [
+            threading.Thread(target=target, args=(number,))
+            for number in range(len(workers))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for result in results:
+            if result is not None:
+                recorder.merge(result)
+    return recorder.report(time.perf_counter() - started)
@@ -0,0 +1,37 @@
+import json
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Показывает счётчики кэша: попадания, промахи, вытеснения, объём'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default')
+        parser.add_argument(
+            '--json', action='store_true', help='Вывести статистику в JSON'
+        )
+        parser.add_argument(
+            '--reset', action='store_true', help='Обнулить счётчики'
+        )
+
+    def handle(self, *args, **options):
+        cache = caches[options['alias']]
+        if not hasattr(cache, 'stats'):
+            raise CommandError(
+                f'Кэш {options["alias"]} не ведёт статистику: '
+                f'{type(cache).__name__}'
+            )
+        stats = cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = (
+            round(stats['hits'] / lookups, 4) if lookups else None
+        )
+        if options['json']:
+            self.stdout.write(json.dumps(stats))
+        else:
+            for name, value in stats.items():
+                self.stdout.write(f'{name}: {value}')
+        if options['reset']:
+            cache.reset_stats()
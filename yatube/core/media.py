@@ -0,0 +1,172 @@
+"""Раздача загруженных файлов.
+
+Если перед приложением стоит nginx или Apache, файл отдаёт он: ответ
+содержит только заголовок `X-Accel-Redirect` или `X-Sendfile`
+(`MEDIA_ACCEL`). Иначе файл читается потоком через `FileResponse` с
+поддержкой `Range`, `ETag` и `Last-Modified`.
+
+Картинки постов и их миниатюры лежат по адресам вида
+`ab/cd/abcd….ext`, выведенным из содержимого, и под тем же именем
+никогда не меняются, поэтому кэшируются браузером навсегда.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# Имена картинок (SHA-256) и миниатюр sorl (MD5) из core.storage и
+# posts.imaging.
+IMMUTABLE_NAME = re.compile(
+    r'(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{28,})(?:\.\w+)?$'
+)
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def is_immutable(name):
+    return bool(IMMUTABLE_NAME.search(name))
+
+
+def file_etag(name, stat_result):
+    """ETag файла: хэш из имени, а у прочих файлов — время и размер.
+
+    Время изменения файла с именем по содержимому сдвигается при
+    повторной загрузке (`core.storage`), а содержимое — нет.
+    """
+    match = IMMUTABLE_NAME.search(name)
+    if match:
+        return f'"{match.group(3)}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def requested_range(request, size, etag, last_modified):
+    """Диапазон байт (начало, конец) из `Range` или None для всего файла.
+
+    Несколько диапазонов сразу не поддерживаются: по RFC 7233 на такой
+    запрос можно ответить целым файлом. Если диапазон вне файла,
+    выбрасывает ValueError.
+    """
+    header = request.META.get('HTTP_RANGE', '').replace(' ', '')
+    match = RANGE.match(header)
+    if not match or match.groups() == ('', ''):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        if parse_http_date_safe(if_range) != last_modified:
+            return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def accelerated(name, path):
+    accel = settings.MEDIA_ACCEL
+    if accel == 'x-accel-redirect':
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_PREFIX + quote(name)
+        )
+    elif accel == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+    else:
+        return None
+    # Тело, длину и диапазоны берёт на себя фронтовой сервер.
+    return response
+
+
+def streamed(request, path, stat_result, etag, last_modified):
+    size = stat_result.st_size
+    try:
+        byte_range = requested_range(request, size, etag, last_modified)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'))
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            read_range(path, start, length), status=206
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve(request, path):
+    name = posixpath.normpath(path).lstrip('/')
+    if any(part.startswith('.') for part in name.split('/')):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+        stat_result = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404
+
+    etag = file_etag(name, stat_result)
+    last_modified = int(stat_result.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = (
+            accelerated(name, full_path)
+            or streamed(request, full_path, stat_result, etag, last_modified)
+        )
+        if response.status_code not in (200, 206):
+            return response
+        content_type, encoding = mimetypes.guess_type(full_path)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        if encoding:
+            response['Content-Encoding'] = encoding
+    elif response.status_code != 304:
+        return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if is_immutable(name):
+        patch_cache_control(
+            response, public=True, immutable=True,
+            max_age=settings.MEDIA_IMMUTABLE_MAX_AGE,
+        )
+    else:
+        patch_cache_control(
+            response, public=True, max_age=settings.MEDIA_MAX_AGE
+        )
+    return response
@@ -0,0 +1,139 @@
+"""Бюджеты SQL-запросов на страницу и поиск N+1.
+
+`QueryBudgetMiddleware` записывает запросы каждого запроса к сайту и
+сверяет их с бюджетом страницы из `QUERY_BUDGETS` (по имени view, иначе
+`QUERY_BUDGET_DEFAULT`). Один и тот же SELECT, выполненный
+`QUERY_REPEAT_THRESHOLD` раз и больше, считается N+1: в отчёт попадают
+строки шаблонов, из которых он выполнялся. Нарушения пишутся в журнал
+или, с `QUERY_BUDGET_RAISE`, выбрасываются как `QueryBudgetExceeded` —
+так их ловят тесты.
+
+Те же проверки доступны без middleware: `record_queries` и
+`assert_within_budget`.
+"""
+import logging
+import re
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_CONTROL = re.compile(
+    r'\s*(SAVEPOINT|RELEASE|ROLLBACK|BEGIN|COMMIT)\b', re.IGNORECASE
+)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def template_line():
+    """Шаблон и строка узла, который сейчас отрисовывается, или None."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        # type(), а не isinstance: тот обратился бы к __class__ ленивых
+        # объектов вроде request.user и выполнил бы их запросы.
+        if issubclass(type(node), Node) and getattr(node, 'token', None):
+            return f'{node.origin.template_name}:{node.token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+class QueryLog:
+    """Запросы, выполненные через соединение (`execute_wrapper`).
+
+    Точки сохранения транзакций не считаются: их число зависит от
+    вложенности `atomic`, а не от работы страницы.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not TRANSACTION_CONTROL.match(sql):
+            self.queries.append((sql, template_line()))
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def repeated(self, threshold=None):
+        """SELECT'ы, повторённые не меньше `threshold` раз.
+
+        Возвращает [(sql, число, строки шаблонов)], частые — первыми.
+        """
+        threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        places = defaultdict(list)
+        for sql, place in self.queries:
+            if sql.lstrip().upper().startswith('SELECT') and not any(
+                table in sql for table in settings.QUERY_REPEAT_IGNORE
+            ):
+                places[sql].append(place)
+        return sorted(
+            (
+                (sql, len(where), sorted(set(filter(None, where))))
+                for sql, where in places.items()
+                if len(where) >= threshold
+            ),
+            key=lambda item: -item[1],
+        )
+
+
+@contextmanager
+def record_queries(using=connection):
+    log = QueryLog()
+    with using.execute_wrapper(log):
+        yield log
+
+
+def budget(view_name):
+    return settings.QUERY_BUDGETS.get(
+        view_name, settings.QUERY_BUDGET_DEFAULT
+    )
+
+
+def problems(log, view_name, limit=None):
+    """Описания нарушений бюджета и повторов для отчёта."""
+    limit = budget(view_name) if limit is None else limit
+    found = []
+    if len(log) > limit:
+        found.append(f'{view_name}: {len(log)} запросов при бюджете {limit}')
+    for sql, count, places in log.repeated():
+        found.append(
+            f'{view_name}: N+1, {count} раз '
+            f'из {", ".join(places) or "кода view"}: {sql[:200]}'
+        )
+    return found
+
+
+def assert_within_budget(log, view_name, limit=None):
+    found = problems(log, view_name, limit)
+    if found:
+        raise QueryBudgetExceeded('\n'.join(found))
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with record_queries() as log:
+            response = self.get_response(request)
+        match = request.resolver_match
+        if match is None:
+            return response
+        if settings.QUERY_BUDGET_RAISE:
+            assert_within_budget(log, match.view_name)
+        else:
+            for problem in problems(log, match.view_name):
+                logger.warning('%s %s', request.path, problem)
+        return response
@@ -0,0 +1,95 @@
+"""Файловое хранилище с адресацией по содержимому.
+
+Файл называется SHA-256 своего содержимого и раскладывается по
+вложенным каталогам `<каталог>/ab/cd/abcd….ext`, поэтому одинаковые
+загрузки хранятся один раз, а ни один каталог не разрастается до
+миллионов записей. Одинаковое содержимое — одинаковое имя, так что
+параллельная запись одного и того же файла безопасна: побеждает
+атомарная замена, а результат тот же.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME = re.compile(
+    r'(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})(\.\w+)?$'
+)
+INCOMING = '.incoming'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def is_hashed(self, name):
+        """Лежит ли файл уже по адресу своего содержимого."""
+        return bool(name and HASHED_NAME.search(name))
+
+    def hashed_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return '/'.join(filter(None, (
+            directory, digest[:2], digest[2:4], digest + extension
+        )))
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым: занятое имя — тот же файл.
+        return name
+
+    def _save(self, name, content):
+        incoming = os.path.join(self.location, INCOMING)
+        os.makedirs(incoming, exist_ok=True)
+        hasher = hashlib.sha256()
+        descriptor, temporary = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    file.write(chunk)
+            return self._place(temporary, name, hasher.hexdigest())
+        finally:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+
+    def _place(self, path, name, digest, keep=False):
+        """Кладёт файл `path` на адрес содержимого, если его там нет.
+
+        С `keep` исходный файл остаётся на месте: новый — жёсткая ссылка
+        на него или, если ссылку сделать нельзя, копия.
+        """
+        name = self.hashed_name(name, digest)
+        full_path = self.path(name)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if not keep:
+                os.replace(path, full_path)
+            else:
+                try:
+                    os.link(path, full_path)
+                except OSError:
+                    shutil.copyfile(path, full_path)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        else:
+            # Файл снова нужен: удаление «свежих» файлов откладывается.
+            os.utime(full_path)
+        return name
+
+    def relocate(self, name):
+        """Кладёт старый файл на адрес его содержимого и возвращает имя.
+
+        Старый файл не удаляется: это делает вызывающий, когда ссылки на
+        него в базе уже заменены.
+        """
+        if self.is_hashed(name):
+            return name
+        path = self.path(name)
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in File(file).chunks():
+                hasher.update(chunk)
+        return self._place(path, name, hasher.hexdigest(), keep=True)
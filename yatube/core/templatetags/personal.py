@@ -0,0 +1,20 @@
+from django import template
+
+from core import fragments
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def personal(context, template_name, **params):
+    """Фрагмент, зависящий от пользователя.
+
+    В общей закэшированной странице выводит метку, которую заменит
+    второй проход; иначе сразу отрисовывает фрагмент. Параметры должны
+    быть строками или числами, фрагменту доступны только они, `request`
+    и переменные контекст-процессоров.
+    """
+    request = context['request']
+    if fragments.is_deferred(request):
+        return fragments.placeholder(template_name, params)
+    return fragments.render_fragment(request, template_name, params)
@@ -0,0 +1,31 @@
+"""Настройки, с которыми идут тесты.
+
+Тесты не должны видеть кэш запущенного сайта (`cache.sqlite3`) и не
+готовят миниатюры в фоновых потоках: те пережили бы откат транзакции
+теста. Для `manage.py test` настройки включает `TestRunner`
+(`TEST_RUNNER`), для pytest — фикстура корневого `conftest.py`.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def test_settings():
+    return override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            }
+        },
+        THUMBNAIL_PREGENERATE=False,
+    )
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = test_settings()
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
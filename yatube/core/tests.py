@@ -0,0 +1,319 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.base import CacheKeyWarning
+from django.test import SimpleTestCase, override_settings
+
+from . import benchmark, loadtest
+from .cache import SQLiteCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        options.setdefault('FLUSH_INTERVAL', 0)
+        return SQLiteCache(
+            f'{self.directory}/cache.sqlite3', {'OPTIONS': options}
+        )
+
+    def test_shared_between_instances(self):
+        """Запись видна другому экземпляру, открывшему тот же файл"""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.make_cache().get('key'), {'value': 1})
+
+    def test_add_incr_and_expiry(self):
+        """add не перезаписывает ключ, incr атомарен, срок соблюдается"""
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('short', 'value', 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 'new'))
+
+    def test_lru_eviction_by_size(self):
+        """При переполнении вытесняются давно не читавшиеся записи"""
+        cache = self.make_cache(MAX_BYTES=3000, TOUCH_INTERVAL=0)
+        cache.set('old', 'x' * 1000)
+        cache.set('used', 'x' * 1000)
+        cache.get('used')
+        cache.set('new', 'x' * 1000)
+        self.assertIsNone(cache.get('old'))
+        self.assertIsNotNone(cache.get('used'))
+        self.assertIsNotNone(cache.get('new'))
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertLessEqual(stats['bytes'], 3000)
+
+    def test_byte_total_follows_writes(self):
+        """Суммарный размер ведётся при любых изменениях записей"""
+        cache = self.make_cache(MAX_BYTES=10000)
+
+        def assert_total():
+            self.assertEqual(cache.stats()['bytes'], cache.connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM cache'
+            ).fetchone()[0])
+
+        cache.set_many({'a': 'x' * 100, 'b': 'x' * 200})
+        cache.set('a', 'x' * 300)
+        cache.add('counter', 1)
+        cache.incr('counter', 10 ** 30)
+        assert_total()
+        cache.delete('b')
+        assert_total()
+        cache.reset_stats()
+        assert_total()
+        cache.clear()
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_expired_removed_when_over_limit(self):
+        """Просроченные записи вытесняются первыми и только при переполнении"""
+        cache = self.make_cache(MAX_BYTES=2500)
+        cache.set('expired', 'x' * 1000, 0.01)
+        cache.set('kept', 'x' * 1000)
+        time.sleep(0.02)
+        cache.set('small', 'x')
+        self.assertEqual(cache.stats()['entries'], 3)
+        cache.set('new', 'x' * 1000)
+        self.assertEqual(cache.get_many(['kept', 'small', 'new']).keys(), {
+            'kept', 'small', 'new',
+        })
+        self.assertEqual(cache.stats()['entries'], 3)
+
+    def test_keys_validated(self):
+        """Все методы предупреждают о недопустимых ключах"""
+        key = 'ключ с пробелом' * 20
+        for call in (
+            lambda: self.cache.touch(key),
+            lambda: self.cache.delete_many([key]),
+            lambda: self.cache.get(key),
+        ):
+            with self.assertWarns(CacheKeyWarning):
+                call()
+
+    def test_stats(self):
+        """Счётчики попаданий и промахов"""
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2}
+        )
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertEqual(stats['entries'], 2)
+
+
+class MediaServeTests(SimpleTestCase):
+    hashed = 'posts/ab/cd/abcd' + '0' * 60 + '.png'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        media_root = override_settings(MEDIA_ROOT=self.directory)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.content = bytes(range(256)) * 4
+        for name in (self.hashed, 'posts/old.png', '.incoming/tmp'):
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(self.content)
+
+    def test_streams_file_with_validators(self):
+        """Файл отдаётся целиком с ETag, Last-Modified и типом"""
+        response = self.client.get('/media/posts/old.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Content-Length'], '1024')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=3600', response['Cache-Control'])
+        self.assertNotIn('immutable', response['Cache-Control'])
+        not_modified = self.client.get(
+            '/media/posts/old.png', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        not_modified = self.client.get(
+            '/media/posts/old.png',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_hashed_names_are_immutable(self):
+        """Имена по содержимому кэшируются навсегда"""
+        response = self.client.get(f'/media/{self.hashed}')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertEqual(response['ETag'], '"abcd' + '0' * 60 + '"')
+        # Повторная загрузка того же содержимого обновляет время файла.
+        os.utime(os.path.join(self.directory, self.hashed), (0, 0))
+        again = self.client.get(f'/media/{self.hashed}')
+        self.assertEqual(again['ETag'], response['ETag'])
+
+    def test_ranges(self):
+        """Диапазоны: обычный, с конца, открытый и вне файла"""
+        cases = {
+            'bytes=10-19': (10, 19),
+            'bytes=-16': (1008, 1023),
+            'bytes=1000-': (1000, 1023),
+            'bytes=1000-5000': (1000, 1023),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get(
+                    '/media/posts/old.png', HTTP_RANGE=header
+                )
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content),
+                    self.content[start:end + 1],
+                )
+                self.assertEqual(
+                    response['Content-Range'], f'bytes {start}-{end}/1024'
+                )
+                self.assertEqual(
+                    response['Content-Length'], str(end - start + 1)
+                )
+        response = self.client.get(
+            '/media/posts/old.png', HTTP_RANGE='bytes=2000-'
+        )
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_stale_if_range_returns_whole_file(self):
+        """Если файл сменился, вместо диапазона отдаётся весь файл"""
+        response = self.client.get(
+            '/media/posts/old.png',
+            HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"',
+        )
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(
+            '/media/posts/old.png', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag
+        )
+        self.assertEqual(response.status_code, 206)
+
+    def test_hidden_and_outside_files_are_not_found(self):
+        """Служебные каталоги, каталоги и выход за MEDIA_ROOT — 404"""
+        for url in (
+            '/media/.incoming/tmp', '/media/posts/', '/media/posts/missing',
+            '/media/../settings.py', '/media/posts/%2e%2e/%2e%2e/x',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_delegates_to_front_server(self):
+        """С MEDIA_ACCEL тело отдаёт nginx или Apache"""
+        with self.settings(MEDIA_ACCEL='x-accel-redirect'):
+            response = self.client.get(f'/media/{self.hashed}')
+        self.assertEqual(
+            response['X-Accel-Redirect'], f'/protected-media/{self.hashed}'
+        )
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        with self.settings(MEDIA_ACCEL='x-sendfile'):
+            response = self.client.get('/media/posts/old.png')
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.join(self.directory, 'posts/old.png'),
+        )
+        self.assertEqual(response.content, b'')
+
+
+class LoadTestHarnessTests(SimpleTestCase):
+    @staticmethod
+    def application(environ, start_response):
+        status = '404 Not Found' if 'missing' in environ['PATH_INFO'] else (
+            '200 OK'
+        )
+        start_response(status, [('Set-Cookie', 'visit=1; Path=/')])
+        return [environ.get('HTTP_COOKIE', '').encode()]
+
+    def test_percentile(self):
+        """Перцентиль по ближайшему рангу"""
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 0.5), 50)
+        self.assertEqual(loadtest.percentile(values, 0.99), 99)
+        self.assertEqual(loadtest.percentile([7], 0.95), 7)
+        self.assertIsNone(loadtest.percentile([], 0.5))
+
+    def test_threads_report_per_view(self):
+        """Потоки сливают замеры в отчёт по именам view"""
+        def worker(make_client, deadline):
+            client = make_client()
+            client.get('/about/author/')
+            self.assertEqual(client.get('/about/tech/')[2], b'visit=1')
+            client.get('/missing/')
+
+        report = loadtest.run(self.application, [worker] * 3, duration=0)
+        self.assertEqual(report['requests'], 9)
+        self.assertEqual(report['errors'], 3)
+        author = report['endpoints']['about:author']
+        self.assertEqual(author['requests'], 3)
+        self.assertEqual(author['statuses'], {'200': 3})
+        self.assertEqual(author['queries'], {'mean': 0, 'max': 0})
+        self.assertLessEqual(
+            author['latency_ms']['p50'], author['latency_ms']['p99']
+        )
+        self.assertEqual(report['endpoints']['/missing/']['errors'], 3)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def result(self, samples):
+        return {'median': benchmark.median(samples), 'samples': samples}
+
+    def test_run_excludes_setup(self):
+        """Подготовка не входит в замер, раундов столько, сколько задано"""
+        calls = []
+        item = benchmark.Benchmark(
+            'sleepy_setup', lambda: calls.append(1),
+            lambda: time.sleep(0.005),
+        )
+        results = benchmark.run([item], repeat=4, min_time=0)
+        self.assertEqual(len(results['sleepy_setup']['samples']), 4)
+        self.assertLess(results['sleepy_setup']['median'], 0.001)
+        self.assertEqual(len(calls), 5)
+
+    def test_mann_whitney(self):
+        """Критерий различает сдвиг выборок и не видит его в одинаковых"""
+        low = [1.0 + i / 100 for i in range(15)]
+        high = [1.5 + i / 100 for i in range(15)]
+        self.assertLess(benchmark.mann_whitney_greater(high, low), 1e-4)
+        self.assertGreater(benchmark.mann_whitney_greater(low, high), 0.99)
+        self.assertAlmostEqual(
+            benchmark.mann_whitney_greater(low, list(low)), 0.5, delta=0.1
+        )
+
+    def test_compare(self):
+        """Замедление — рост медианы выше порога при значимом сдвиге"""
+        base = [1.0 + i / 100 for i in range(15)]
+        baseline = {
+            'slower': self.result(base),
+            'noisy': self.result(base),
+            'small': self.result(base),
+            'faster': self.result(base),
+        }
+        noisy = [0.5 + i / 10 for i in range(15)]
+        rows = {row['name']: row for row in benchmark.compare(baseline, {
+            'slower': self.result([value * 1.3 for value in base]),
+            'noisy': self.result(noisy + [2.0] * 4),
+            'small': self.result([value * 1.1 for value in base]),
+            'faster': self.result([value * 0.5 for value in base]),
+            'new': self.result(base),
+        }, threshold=0.2, alpha=0.01)}
+        self.assertEqual(rows['slower']['status'], benchmark.SLOWER)
+        self.assertAlmostEqual(rows['slower']['change'], 0.3)
+        self.assertEqual(rows['noisy']['status'], benchmark.SAME)
+        self.assertEqual(rows['small']['status'], benchmark.SAME)
+        self.assertEqual(rows['faster']['status'], benchmark.FASTER)
+        self.assertEqual(rows['new']['status'], benchmark.NEW)
@@ -0,0 +1,48 @@
+"""Приём загружаемых файлов с ограничением объёма.
+
+Файл сразу пишется во временный файл на диске, а не копится в памяти
+процесса. Всё, что пришло сверх `MAX_UPLOAD_SIZE`, отбрасывается: файл
+помечается как `oversized`, и поле формы отклоняет его, не открывая.
+
+Обработчик включается только для view с декоратором `limit_uploads`:
+остальные формы принимают файлы стандартными обработчиками Django.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.MAX_UPLOAD_SIZE:
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.oversized = self.received > settings.MAX_UPLOAD_SIZE
+        return file
+
+
+def limit_uploads(view):
+    """Принимает файлы запросов к `view` через `LimitedUploadHandler`.
+
+    Обработчики можно сменить только до разбора тела запроса, а его уже
+    читает `CsrfViewMiddleware`, поэтому проверка CSRF переносится внутрь
+    декоратора, как советует документация Django.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [LimitedUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
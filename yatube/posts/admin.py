@@ -1,15 +1,26 @@
 from django.contrib import admin
+from django.db import transaction
 
+from . import search
 from .models import Comment, Follow, Group, Post
 
 
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'text', 'pub_date', 'author', 'group')
+    list_display = (
+        'pk', 'text', 'pub_date', 'author', 'group', 'comment_count'
+    )
     list_editable = ('group',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт через полнотекстовый индекс, а не LIKE.
+        match = search.match_query(search_term)
+        if match is None:
+            return queryset, False
+        return search.matching(queryset, match), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description')
@@ -26,6 +37,11 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ('created',)
     empty_value_display = '-пусто-'
 
+    def delete_queryset(self, request, queryset):
+        # Счётчики постов обновляются сигналами, удаляем всё одной транзакцией.
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'author')
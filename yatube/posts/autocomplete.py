@@ -0,0 +1,199 @@
+"""Подсказки авторов и групп по началу имени.
+
+Имена пользователей, полные имена, названия и слаги групп хранятся в
+памяти процесса отсортированным массивом; подсказки по префиксу — один
+`bisect` и проход по соседним ключам, без запросов к базе. Каждое слово
+названия тоже становится ключом, так что «Петров» находится и по
+«пет», и по «иван пет».
+
+Индекс загружается при первом запросе. Сигналы после фиксации
+транзакции правят его на месте и повышают общую версию в кэше; другие
+процессы раз в `AUTOCOMPLETE_CHECK_INTERVAL` секунд сверяют версию и,
+если она ушла вперёд, загружают индекс заново.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.db import transaction
+from django.urls import reverse
+
+from . import cache
+from .models import Group, User
+from .search import normalize
+
+SCOPE = 'autocomplete'
+USER = 'user'
+GROUP = 'group'
+
+
+def terms(*texts):
+    """Ключи для названий: всё название и его хвосты с каждого слова."""
+    result = []
+    for text in texts:
+        words = normalize(text).split()
+        result.extend(' '.join(words[start:]) for start in range(len(words)))
+    return list(dict.fromkeys(result))
+
+
+def user_item(pk, username, first_name, last_name):
+    full_name = f'{first_name} {last_name}'.strip()
+    return (USER, pk), {
+        'type': USER,
+        'label': f'{full_name} (@{username})' if full_name else username,
+        'url': reverse('posts:profile', args=(username,)),
+    }, terms(username, full_name)
+
+
+def group_item(pk, title, slug):
+    return (GROUP, pk), {
+        'type': GROUP,
+        'label': title,
+        'url': reverse('posts:group_list', args=(slug,)),
+    }, terms(title, slug)
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.version = None
+        self.checked_at = 0
+        # Параллельные массивы: отсортированные ключи и ссылки на записи.
+        self.keys = []
+        self.refs = []
+        self.items = {}
+
+    def load(self):
+        self.clear()
+        self.version, = cache.get_versions([SCOPE])
+        entries = []
+        users = User.objects.values_list(
+            'pk', 'username', 'first_name', 'last_name'
+        )
+        groups = Group.objects.values_list('pk', 'title', 'slug')
+        for ref, item, keys in (
+            *(user_item(*row) for row in users.iterator()),
+            *(group_item(*row) for row in groups.iterator()),
+        ):
+            self.items[ref] = item, keys
+            entries.extend((key, ref) for key in keys)
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.refs = [ref for _, ref in entries]
+        self.loaded = True
+        self.checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self.loaded and (
+            now - self.checked_at < settings.AUTOCOMPLETE_CHECK_INTERVAL
+        ):
+            return
+        if self.loaded:
+            self.checked_at = now
+            if cache.get_versions([SCOPE]) == [self.version]:
+                return
+        self.load()
+
+    def complete(self, prefix, limit):
+        """Записи, у которых есть ключ с таким началом, по алфавиту."""
+        prefix = ' '.join(normalize(prefix).split())
+        if not prefix:
+            return []
+        with self.lock:
+            self.ensure_fresh()
+            results, seen = [], set()
+            position = bisect_left(self.keys, prefix)
+            while position < len(self.keys) and len(results) < limit:
+                if not self.keys[position].startswith(prefix):
+                    break
+                ref = self.refs[position]
+                if ref not in seen:
+                    seen.add(ref)
+                    results.append(self.items[ref][0])
+                position += 1
+            return results
+
+    def remove(self, ref):
+        _, keys = self.items.pop(ref, (None, ()))
+        for key in keys:
+            position = bisect_left(self.keys, key)
+            end = bisect_right(self.keys, key)
+            position += self.refs[position:end].index(ref)
+            del self.keys[position]
+            del self.refs[position]
+
+    def put(self, ref, item, keys):
+        self.remove(ref)
+        self.items[ref] = item, keys
+        for key in keys:
+            position = bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.refs.insert(position, ref)
+
+    def changed(self, ref, entry=None):
+        """Правит индекс после фиксации транзакции с изменением записи.
+
+        Откаченное изменение так не оставляет в индексе лишних записей.
+        """
+        transaction.on_commit(lambda: self.apply(ref, entry))
+
+    def apply(self, ref, entry):
+        """Правит индекс и повышает общую версию.
+
+        Если версию за это время повысил кто-то ещё, своей правки мало:
+        индекс будет загружен заново при следующем запросе. Вытесненный
+        ключ версии ставится заново напрямую: `cache.bump` откладывает
+        второе повышение до фиксации, а она уже прошла, и процессы
+        загрузили бы индекс ещё раз.
+        """
+        key = cache.VERSION_KEY.format(SCOPE)
+        try:
+            version = shared_cache.incr(key)
+        except ValueError:
+            shared_cache.add(key, time.time_ns() // 1000, None)
+            version = None
+        with self.lock:
+            if not self.loaded:
+                return
+            if version is None or version != self.version + 1:
+                self.loaded = False
+                return
+            self.version = version
+            if entry is None:
+                self.remove(ref)
+            else:
+                self.put(*entry)
+
+
+index = PrefixIndex()
+
+
+def complete(prefix, limit=None):
+    return index.complete(prefix, limit or settings.AUTOCOMPLETE_LIMIT)
+
+
+def user_changed(user):
+    index.changed((USER, user.pk), user_item(
+        user.pk, user.username, user.first_name, user.last_name
+    ))
+
+
+def user_deleted(user_id):
+    index.changed((USER, user_id))
+
+
+def group_changed(group):
+    index.changed(
+        (GROUP, group.pk), group_item(group.pk, group.title, group.slug)
+    )
+
+
+def group_deleted(group_id):
+    index.changed((GROUP, group_id))
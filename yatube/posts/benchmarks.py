@@ -0,0 +1,165 @@
+"""Набор микробенчмарков постов для команды `benchmark`.
+
+Каждая функция `posts.views` вызывается напрямую с запросом из
+`RequestFactory`, без middleware. Ленты с `cache_feed` меряются с
+пустым кэшем, то есть со сборкой страницы; главная — ещё и из кэша.
+Изменяющие view выполняются в транзакции, которая откатывается после
+каждого вызова. Отдельно меряются отрисовка шаблонов главной и поста и
+запросы ORM, на которых они построены.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from core.benchmark import Benchmark
+
+from . import search, stats, timeline, views
+from .forms import CommentForm
+from .models import AuthorStats, Follow, Group, Post, User
+
+
+class Fixtures:
+    """Типичные объекты засеянной базы для запросов бенчмарков."""
+
+    def __init__(self):
+        self.post = Post.objects.select_related('author').annotate(
+            total=Count('comments')
+        ).order_by('-total', '-pk')[:1].get()
+        self.group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total', 'pk')[:1].get()
+        # Самый популярный автор: его профиль и подписки — худший случай.
+        top = AuthorStats.objects.order_by('-followers_count').first()
+        self.author = top.author if top else self.post.author
+        self.reader = User.objects.filter(
+            pk__in=Follow.objects.values('user')
+        ).exclude(pk=self.author.pk).order_by('pk').first() or (
+            User.objects.exclude(pk=self.author.pk).order_by('pk').first()
+        )
+        self.word = self.post.text.split()[0].strip('.,')
+        self.prefix = self.author.username[:3]
+        self.factory = RequestFactory()
+
+    def request(self, path, user=None, method='get', data=None):
+        request = getattr(self.factory, method)(path, data or {})
+        request.user = user or AnonymousUser()
+        return request
+
+
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def view(name, call, cold=True):
+    """Бенчмарк view; `cold` очищает кэш лент перед каждым вызовом."""
+    return Benchmark(f'view:{name}', call, cache.clear if cold else None)
+
+
+def write_view(name, call):
+    def func():
+        with rolled_back():
+            call()
+    return Benchmark(f'view:{name}', func)
+
+
+def suite(fixtures=None):
+    """Бенчмарки для текущей базы."""
+    f = fixtures or Fixtures()
+    post, group, author, reader = f.post, f.group, f.author, f.reader
+    per_page = settings.OBJECTS_PER_PAGE
+
+    index_posts = Post.objects.select_related('author', 'group')
+    # Шаблоны получают уже выбранные данные: запросы меряются отдельно.
+    page = Paginator(index_posts, per_page).page(1)
+    page.object_list = list(page.object_list)
+    detail_context = {
+        'post': post,
+        'author_stats': stats.get_stats(post.author_id),
+        'form': CommentForm(),
+        'comments': list(post.comments.select_related('author')),
+    }
+    anonymous = f.request('/')
+    detail_request = f.request(f'/posts/{post.pk}/', reader)
+
+    def warm_index():
+        views.index(f.request('/'))
+
+    warm_index()
+    return [
+        view('index', lambda: views.index(f.request('/'))),
+        view('index:cached', warm_index, cold=False),
+        view('group_posts', lambda: views.group_posts(
+            f.request(f'/group/{group.slug}/'), slug=group.slug
+        )),
+        view('profile', lambda: views.profile(
+            f.request(f'/profile/{author.username}/'),
+            username=author.username,
+        )),
+        view('search', lambda: views.search(
+            f.request('/search/', data={'q': f.word})
+        )),
+        view('autocomplete', lambda: views.autocomplete(
+            f.request('/autocomplete/', data={'q': f.prefix})
+        ), cold=False),
+        view('post_detail', lambda: views.post_detail(
+            f.request(f'/posts/{post.pk}/'), post_id=post.pk
+        )),
+        view('post_create', lambda: views.post_create(
+            f.request('/create/', reader)
+        )),
+        view('post_edit', lambda: views.post_edit(
+            f.request(f'/posts/{post.pk}/edit/', post.author),
+            post_id=post.pk,
+        )),
+        view('follow_index', lambda: views.follow_index(
+            f.request('/follow/', reader)
+        )),
+        write_view('add_comment', lambda: views.add_comment(
+            f.request(
+                f'/posts/{post.pk}/comment/', reader, 'post',
+                {'text': 'Комментарий бенчмарка'},
+            ),
+            post_id=post.pk,
+        )),
+        write_view('profile_follow', lambda: views.profile_follow(
+            f.request(f'/profile/{author.username}/follow/', reader),
+            username=author.username,
+        )),
+        write_view('profile_unfollow', lambda: views.profile_unfollow(
+            f.request(f'/profile/{author.username}/unfollow/', reader),
+            username=author.username,
+        )),
+        Benchmark('template:posts/index.html', lambda: render_to_string(
+            'posts/index.html', {'page_obj': page}, anonymous
+        )),
+        Benchmark('template:posts/post_detail.html', lambda: render_to_string(
+            'posts/post_detail.html', detail_context, detail_request
+        )),
+        Benchmark('query:index', lambda: list(index_posts[:per_page])),
+        Benchmark('query:group_posts', lambda: list(
+            group.posts.select_related('author', 'group')[:per_page]
+        )),
+        Benchmark('query:profile', lambda: list(
+            author.posts.select_related('author', 'group')[:per_page]
+        )),
+        Benchmark('query:post_detail', lambda: (
+            Post.objects.select_related('author', 'group').get(pk=post.pk),
+            list(post.comments.select_related('author')),
+        )),
+        Benchmark('query:follow_index', lambda: list(
+            timeline.timeline_posts(reader)[0][:per_page]
+        )),
+        Benchmark('query:search', lambda: list(search.search(
+            search.match_query(f.word)
+        ).order_by('rank')[:per_page])),
+    ]
@@ -0,0 +1,86 @@
+"""Подсчёт ссылок постов на общие файлы картинок.
+
+Хранилище картинок адресует файлы по содержимому, поэтому один файл
+может принадлежать нескольким постам. Счётчик ведётся только для файлов,
+уже лежащих по адресу содержимого; старые имена переносит и учитывает
+команда `rehash_images`.
+
+Файл без ссылок удаляется сразу после фиксации, только если он старше
+`FRESH_SECONDS`: хранилище обновляет время изменения файла и при
+повторной загрузке того же содержимого, а ссылку на него параллельная
+транзакция может добавить позже. Оставшиеся файлы удалит
+`collect_media_garbage`.
+"""
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import ImageBlob, Post
+from .models import image_storage as storage
+
+FRESH_SECONDS = 60 * 60
+
+
+def acquire(name):
+    """Добавляет ссылку на файл."""
+    if not storage.is_hashed(name):
+        return
+    with transaction.atomic():
+        updated = ImageBlob.objects.filter(name=name).update(
+            references=F('references') + 1
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    ImageBlob.objects.create(name=name, references=1)
+            except IntegrityError:
+                ImageBlob.objects.filter(name=name).update(
+                    references=F('references') + 1
+                )
+
+
+def release(name):
+    """Убирает ссылку; файл без ссылок удаляется после фиксации."""
+    if not storage.is_hashed(name):
+        return
+    with transaction.atomic():
+        ImageBlob.objects.filter(name=name).update(
+            references=F('references') - 1
+        )
+        deleted, _ = ImageBlob.objects.filter(
+            name=name, references=0
+        ).delete()
+    if deleted:
+        transaction.on_commit(lambda: delete_unused(name))
+
+
+def delete_unused(name):
+    # Пока шло удаление, ту же картинку могли загрузить снова: ссылка
+    # уже есть или файл только что записан транзакцией, которая её
+    # ещё не зафиксировала.
+    if ImageBlob.objects.filter(name=name).exists():
+        return
+    try:
+        modified = storage.get_modified_time(name).timestamp()
+    except FileNotFoundError:
+        return
+    if modified <= time.time() - FRESH_SECONDS:
+        storage.delete(name)
+
+
+def recount():
+    """Пересчитывает все ссылки по таблице постов."""
+    counts = Post.objects.exclude(image='').values('image').annotate(
+        references=Count('pk')
+    ).order_by()
+    with transaction.atomic():
+        ImageBlob.objects.all().delete()
+        ImageBlob.objects.bulk_create(
+            (
+                ImageBlob(name=row['image'], references=row['references'])
+                for row in counts.iterator()
+                if storage.is_hashed(row['image'])
+            ),
+            batch_size=500,
+        )
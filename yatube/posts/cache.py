@@ -0,0 +1,184 @@
+"""Кэш страниц лент с версиями по областям.
+
+Каждая область (вся лента, группа, автор) хранит в кэше номер версии.
+Закэшированная страница помнит версии, с которыми она собрана, и
+считается устаревшей, как только сигналы моделей повысят версию одной из
+её областей или истечёт мягкий срок жизни. Устаревшую страницу
+пересчитывает один запрос под короткой блокировкой, остальные в это
+время получают прежнюю копию (stale-while-revalidate).
+
+Копия общая для всех пользователей: персональные фрагменты
+подставляются в неё при каждой отдаче (см. `core.fragments`).
+"""
+import hashlib
+import math
+import random
+import time
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core import fragments
+
+from .paginator import InvalidCursor, decode_cursor
+
+VERSION_KEY = 'feed-version:{}'
+PAGE_KEY = 'feed-page:{view}:{path}'
+LOCK_KEY = 'feed-lock:{}'
+
+FEED = 'posts'
+GROUP = 'group:{}'
+AUTHOR = 'author:{}'
+
+Entry = namedtuple('Entry', 'versions soft_expires delta response')
+
+
+def get_versions(scopes):
+    """Текущие версии областей одним запросом к кэшу."""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Начальная версия от времени: если ключ версии вытеснен,
+            # старые страницы с прежними номерами не всплывут.
+            cache.add(key, time.time_ns() // 1000, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    """Повышает версии областей, делая их страницы устаревшими.
+
+    Версии повышаются сразу и ещё раз после фиксации транзакции: страница,
+    которую параллельный запрос успел собрать из старых данных уже под
+    первой новой версией, иначе считалась бы свежей до мягкого срока.
+    """
+    increment(scopes)
+    transaction.on_commit(lambda: increment(scopes))
+
+
+def increment(scopes):
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns() // 1000, None)
+
+
+def bump_post(post, *extra_groups):
+    """Сбрасывает страницы, на которых выводится пост."""
+    scopes = [FEED, AUTHOR.format(post.author.username)]
+    if post.group_id:
+        scopes.append(GROUP.format(post.group.slug))
+    scopes.extend(GROUP.format(slug) for slug in extra_groups if slug)
+    bump(*scopes)
+
+
+def normalize_query(query):
+    """Приводит параметры страницы к виду, в котором их понимает view.
+
+    Лишние параметры отбрасываются, из повторов берётся последний, как
+    в `QueryDict.get`; номер страницы, который пагинатор всё равно
+    заменит первой или последней страницей, сводится к одному значению.
+    Учитывается только параметр включённого режима: номер или курсор.
+    """
+    if settings.POSTS_CURSOR_PAGINATION:
+        cursor = query.get('cursor')
+        if not cursor:
+            return ''
+        try:
+            decode_cursor(cursor)
+        except (InvalidCursor, ValueError, TypeError):
+            # Любой битый курсор пагинатор заменит первой страницей.
+            return ''
+        return f'cursor={cursor}'
+    params = []
+    page = query.get('page')
+    if page is not None:
+        try:
+            number = int(page)
+        except ValueError:
+            number = 1
+        if number != 1:
+            params.append(f'page={number if number > 0 else "last"}')
+    return '&'.join(params)
+
+
+def page_key(request, view_name):
+    path = f'{request.path}?{normalize_query(request.GET)}'
+    return PAGE_KEY.format(
+        view=view_name, path=hashlib.md5(path.encode()).hexdigest()
+    )
+
+
+def is_fresh(entry, versions, beta):
+    """Свежа ли копия с учётом вероятностного раннего обновления.
+
+    Чем ближе мягкий срок и чем дольше страница собиралась, тем выше
+    шанс, что отдельный запрос обновит её заранее (XFetch).
+    """
+    if entry.versions != versions:
+        return False
+    early = entry.delta * beta * -math.log(1 - random.random())
+    return time.time() + early < entry.soft_expires
+
+
+def cache_feed(*scopes, soft_timeout=None, hard_timeout=None, beta=None):
+    """Кэширует страницу ленты, заменяя `cache_page`.
+
+    Области задаются шаблонами, подставляемыми из аргументов view:
+    `@cache_feed(GROUP.format('{slug}'))`. Мягкий срок задаёт, когда
+    копию пора пересчитать, жёсткий — сколько её можно отдавать, пока
+    идёт пересчёт.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions = get_versions(
+                [scope.format(**kwargs) for scope in scopes]
+            )
+            key = page_key(request, view.__name__)
+            entry = cache.get(key)
+            if entry is not None and is_fresh(
+                entry,
+                versions,
+                settings.FEED_CACHE_BETA if beta is None else beta,
+            ):
+                return fragments.personalize(request, entry.response)
+            lock = LOCK_KEY.format(key)
+            if not cache.add(lock, 1, settings.FEED_CACHE_LOCK_TIMEOUT):
+                if entry is not None:
+                    return fragments.personalize(request, entry.response)
+                return view(request, *args, **kwargs)
+            try:
+                started = time.time()
+                fragments.defer(request)
+                response = view(request, *args, **kwargs)
+                # Куки ответа принадлежат этому запросу: такая копия не
+                # может быть общей.
+                if response.status_code == 200 and not response.cookies:
+                    finished = time.time()
+                    cache.set(
+                        key,
+                        Entry(
+                            versions,
+                            finished + (
+                                soft_timeout
+                                or settings.FEED_CACHE_SOFT_TIMEOUT
+                            ),
+                            finished - started,
+                            response,
+                        ),
+                        hard_timeout or settings.FEED_CACHE_TIMEOUT,
+                    )
+            finally:
+                cache.delete(lock)
+            return fragments.personalize(request, response)
+        return wrapper
+    return decorator
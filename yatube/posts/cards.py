@@ -0,0 +1,58 @@
+"""Кэш отрисованных карточек постов.
+
+Ключ карточки собирается из данных, которые в ней выводятся: времени
+изменения поста, числа комментариев, имени автора и группы. Правка поста
+или смена автора и группы дают новый ключ, а карточки всей страницы
+достаются из кэша одним запросом. Для карточек, которых в кэше нет,
+миниатюры картинок тоже ищутся разом, до отрисовки.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import thumbnails
+
+CARD_KEY = 'post-card:{template}:{pk}:{digest}'
+
+
+def card_key(template_name, post):
+    group = post.group
+    state = (
+        post.updated.isoformat(),
+        post.comment_count,
+        post.image.name,
+        post.image_width,
+        post.image_height,
+        post.image_color,
+        post.author.username,
+        post.author.get_full_name(),
+        group and (group.slug, group.title),
+    )
+    digest = hashlib.md5(repr(state).encode()).hexdigest()
+    return CARD_KEY.format(template=template_name, pk=post.pk, digest=digest)
+
+
+def render_cards(posts, template_name):
+    """Пары (пост, карточка) для страницы с одним обращением к кэшу."""
+    posts = list(posts)
+    keys = [card_key(template_name, post) for post in posts]
+    cached = cache.get_many(keys)
+    thumbnails.prefetch(
+        [post for post, key in zip(posts, keys) if key not in cached]
+    )
+    rendered = {}
+    cards = []
+    for post, key in zip(posts, keys):
+        card = cached.get(key)
+        if card is None:
+            card = render_to_string(template_name, {'post': post})
+            # Пока миниатюры готовятся, карточка без них не кэшируется.
+            if post.thumbnails_ready:
+                rendered[key] = card
+        cards.append((post, mark_safe(card)))
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+    return cards
@@ -1,13 +1,67 @@
 from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
 
+from .imaging import EMPTY_IMAGE_METADATA, downscale, image_metadata
 from .models import Comment, Post
 
 
 class PostForm(forms.ModelForm):
+    """Форма поста с проверкой картинки до того, как PIL её декодирует.
+
+    Объём ограничен `MAX_UPLOAD_SIZE`: загрузку сверх него обрывает
+    `core.uploads.LimitedUploadHandler`, и обрезанный файл в поле не
+    попадает. Число пикселей берётся из заголовка и ограничено
+    `MAX_IMAGE_PIXELS`, а картинки больше `MAX_IMAGE_SIDE` уменьшаются.
+    """
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        image = self.files.get('image')
+        self.image_oversized = image is not None and (
+            getattr(image, 'oversized', False)
+            or image.size > settings.MAX_UPLOAD_SIZE
+        )
+        if self.image_oversized:
+            self.files = self.files.copy()
+            del self.files['image']
+
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if self.image_oversized:
+            raise ValidationError(
+                'Файл больше %(limit)s.',
+                code='too_large',
+                params={'limit': filesizeformat(settings.MAX_UPLOAD_SIZE)},
+            )
+        if not isinstance(image, UploadedFile):
+            return image
+        # ImageField уже прочитал заголовок, пиксели ещё не декодированы.
+        width, height = image.image.size
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            raise ValidationError(
+                'Картинка больше %(limit)s мегапикселей.',
+                code='too_many_pixels',
+                params={'limit': settings.MAX_IMAGE_PIXELS // 10 ** 6},
+            )
+        return downscale(image, settings.MAX_IMAGE_SIDE)
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            image = self.cleaned_data['image']
+            metadata = image_metadata(image) if image else (
+                EMPTY_IMAGE_METADATA
+            )
+            for field, value in metadata.items():
+                setattr(self.instance, field, value)
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,128 @@
+"""Поиск файлов картинок и миниатюр, на которые ничего не ссылается.
+
+Все обходы потоковые: каталоги читаются `os.scandir`, хранилище sorl —
+по ключу порциями, а ссылки из постов проверяются одним запросом на
+порцию, так что память не растёт с числом файлов. Свежие файлы не
+трогаются: загрузка кладёт файл раньше, чем фиксируется пост.
+"""
+import os
+from itertools import islice
+
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from .models import Post, image_storage
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def walk(storage, directory):
+    """Файлы каталога хранилища с вложенными: (имя, байт, mtime)."""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(storage.path(current))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{current}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield name, stat.st_size, stat.st_mtime
+
+
+def used_images(names):
+    return set(Post.objects.filter(
+        image__in=names
+    ).values_list('image', flat=True))
+
+
+def orphan_images(directory, before, chunk_size):
+    """Исходные картинки старше `before`, которых нет ни в одном посте."""
+    for chunk in chunked(walk(image_storage, directory), chunk_size):
+        chunk = [item for item in chunk if item[2] < before]
+        used = used_images([name for name, *_ in chunk])
+        for name, size, _ in chunk:
+            if name not in used:
+                yield name, size
+
+
+def values(keys):
+    return dict(KVStore.objects.filter(
+        key__in=list(keys)
+    ).values_list('key', 'value'))
+
+
+def orphan_sources(chunk_size):
+    """Исходники в хранилище sorl, которых нет ни в одном посте.
+
+    Для каждого отдаёт ключи его записей и имена файлов миниатюр.
+    """
+    prefix = add_prefix('', 'thumbnails')
+    last_key = ''
+    while True:
+        rows = list(KVStore.objects.filter(
+            key__startswith=prefix, key__gt=last_key
+        ).order_by('key').values_list('key', 'value')[:chunk_size])
+        if not rows:
+            return
+        last_key = rows[-1][0]
+        thumbnails = {
+            key[len(prefix):]: deserialize(value) or [] for key, value in rows
+        }
+        sources = values(add_prefix(source) for source in thumbnails)
+        names = {
+            key: deserialize(value)['name'] for key, value in sources.items()
+        }
+        used = used_images(list(names.values()))
+        for source, thumbnail_keys in thumbnails.items():
+            name = names.get(add_prefix(source))
+            if name in used:
+                continue
+            thumbnail_keys = [add_prefix(key) for key in thumbnail_keys]
+            yield (
+                [add_prefix(source, 'thumbnails'), add_prefix(source)]
+                + thumbnail_keys,
+                [
+                    deserialize(value)['name']
+                    for value in values(thumbnail_keys).values()
+                ],
+            )
+
+
+def stray_thumbnails(before, chunk_size):
+    """Файлы миниатюр старше `before`, которых нет в хранилище sorl."""
+    for chunk in chunked(
+        walk(default.storage, sorl_settings.THUMBNAIL_PREFIX.rstrip('/')),
+        chunk_size,
+    ):
+        keys = {
+            add_prefix(ImageFile(name, default.storage).key): (name, size)
+            for name, size, mtime in chunk if mtime < before
+        }
+        known = values(keys)
+        for key, (name, size) in keys.items():
+            if key not in known:
+                yield name, size
+
+
+def file_size(storage, name):
+    try:
+        return storage.size(name)
+    except OSError:
+        return 0
@@ -0,0 +1,120 @@
+"""Сценарии нагрузочного прогона `load_test` (см. `core.loadtest`).
+
+Анонимный посетитель листает главную и группы и открывает посты.
+Вошедший читатель, кроме того, читает ленту подписок, комментирует и
+подписывается на автора с отпиской сразу после, так что подписки после
+прогона те же; комментарии остаются в базе.
+"""
+import html
+import random
+import re
+import time
+
+from django.urls import reverse
+
+from .models import Follow, Group, Post, User
+
+# Ссылка «Следующая» обоих пагинаторов: номер страницы или курсор.
+NEXT_PAGE = re.compile(r'href="\?([^"]*)">\s*Следующая')
+SAMPLE = 1000
+
+
+class Scenarios:
+    ANONYMOUS = (
+        ('browse_index', 4), ('browse_group', 3), ('read_post', 3),
+    )
+    AUTHENTICATED = (
+        ('browse_index', 2), ('read_timeline', 3), ('read_post', 2),
+        ('comment', 1), ('toggle_follow', 1),
+    )
+
+    def __init__(self, anonymous_share=0.7, pages=3, seed=0):
+        self.anonymous_share = anonymous_share
+        self.pages = pages
+        self.seed = seed
+        # Свежие посты и их авторы: их открывают чаще всего.
+        recent = Post.objects.order_by('-pk')[:SAMPLE]
+        self.post_ids = list(recent.values_list('pk', flat=True))
+        self.authors = list(dict.fromkeys(
+            recent.values_list('author__username', flat=True)
+        ))
+        self.group_slugs = list(Group.objects.order_by('pk').values_list(
+            'slug', flat=True
+        )[:SAMPLE])
+        self.readers = list(User.objects.filter(
+            pk__in=Follow.objects.values('user')[:SAMPLE]
+        )) or list(User.objects.filter(is_active=True)[:SAMPLE])
+
+    def worker(self, number):
+        """Цикл исполнителя для `core.loadtest.run`."""
+        def run(make_client, deadline):
+            rng = random.Random(f'{self.seed}-{number}')
+            anonymous = make_client()
+            reader = None
+            if self.readers:
+                user = self.readers[number % len(self.readers)]
+                reader = make_client()
+                reader.login(user)
+                # Подписки читателя прогон не трогает: подписка с
+                # отпиской — только на авторов, на которых он не подписан.
+                followed = set(Follow.objects.filter(user=user).values_list(
+                    'author__username', flat=True
+                ))
+                reader.strangers = [
+                    author for author in self.authors
+                    if author not in followed and author != user.username
+                ]
+            while time.perf_counter() < deadline:
+                if reader is None or rng.random() < self.anonymous_share:
+                    client, mix = anonymous, self.ANONYMOUS
+                else:
+                    client, mix = reader, self.AUTHENTICATED
+                names, weights = zip(*mix)
+                getattr(self, rng.choices(names, weights)[0])(client, rng)
+        return run
+
+    def paginate(self, client, url, rng):
+        """Открывает ленту и листает её вперёд на случайное число страниц."""
+        _, _, content = client.get(url)
+        for _ in range(rng.randrange(self.pages)):
+            match = NEXT_PAGE.search(content.decode())
+            if match is None:
+                return
+            _, _, content = client.get(
+                f'{url}?{html.unescape(match.group(1))}'
+            )
+
+    def browse_index(self, client, rng):
+        self.paginate(client, reverse('posts:index'), rng)
+
+    def browse_group(self, client, rng):
+        if not self.group_slugs:
+            return self.browse_index(client, rng)
+        self.paginate(client, reverse(
+            'posts:group_list', args=(rng.choice(self.group_slugs),)
+        ), rng)
+
+    def read_post(self, client, rng):
+        client.get(reverse(
+            'posts:post_detail', args=(rng.choice(self.post_ids),)
+        ))
+
+    def read_timeline(self, client, rng):
+        self.paginate(client, reverse('posts:follow_index'), rng)
+
+    def comment(self, client, rng):
+        post_id = rng.choice(self.post_ids)
+        # Страница поста выдаёт cookie с CSRF-токеном для формы.
+        client.get(reverse('posts:post_detail', args=(post_id,)))
+        client.post(
+            reverse('posts:add_comment', args=(post_id,)),
+            {'text': f'Комментарий нагрузочного прогона {rng.random():.6f}'},
+        )
+
+    def toggle_follow(self, client, rng):
+        if not client.strangers:
+            return self.read_timeline(client, rng)
+        author = rng.choice(client.strangers)
+        client.get(reverse('posts:profile', args=(author,)))
+        client.get(reverse('posts:profile_follow', args=(author,)))
+        client.get(reverse('posts:profile_unfollow', args=(author,)))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет счётчики комментариев постов пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('pk').values_list('pk', flat=True)
+        batch_size = options['batch_size']
+        processed = 0
+        last_post = 0
+        while True:
+            ids = list(posts.filter(pk__gt=last_post)[:batch_size])
+            if not ids:
+                break
+            self.backfill(ids)
+            processed += len(ids)
+            last_post = ids[-1]
+            self.stdout.write(f'Обработано постов: {processed}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, постов: {processed}'
+        ))
+
+    def backfill(self, ids):
+        activity = {
+            post: (total, last)
+            for post, total, last in Comment.objects.filter(post__in=ids)
+            .values_list('post')
+            .annotate(total=Count('pk'), last=Max('created'))
+            .order_by()
+        }
+        updated = [
+            Post(
+                pk=pk,
+                comment_count=activity.get(pk, (0, None))[0],
+                last_commented_at=activity.get(pk, (0, None))[1],
+            )
+            for pk in ids
+        ]
+        with transaction.atomic():
+            Post.objects.bulk_update(
+                updated, ('comment_count', 'last_commented_at')
+            )
@@ -0,0 +1,74 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from posts.imaging import image_metadata
+from posts.models import Post, image_storage
+
+logger = logging.getLogger(__name__)
+
+
+def read_metadata(name):
+    """Метаданные картинки из хранилища; выполняется в дочернем процессе."""
+    try:
+        with image_storage.open(name) as file:
+            return image_metadata(file)
+    except Exception:
+        logger.exception('Не удалось прочитать картинку %s', name)
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры, цвет и заглушку картинок постов параллельно '
+        'на всех ядрах'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов (по умолчанию — число ядер)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--chunk-size', type=int, default=16)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать и уже заполненные посты',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').order_by('pk')
+        if not options['all']:
+            posts = posts.filter(image_width__isnull=True)
+        done = failed = 0
+        last_post = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = list(
+                    posts.filter(pk__gt=last_post)
+                    .values_list('pk', 'image')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_post = batch[-1][0]
+                # Дочерние процессы не должны унаследовать соединение.
+                connections.close_all()
+                results = pool.map(
+                    read_metadata,
+                    [image for _, image in batch],
+                    chunksize=options['chunk_size'],
+                )
+                with transaction.atomic():
+                    for (pk, _), metadata in zip(batch, results):
+                        done += 1
+                        if metadata is None:
+                            failed += 1
+                            continue
+                        Post.objects.filter(pk=pk).update(**metadata)
+                self.stdout.write(f'Обработано картинок: {done}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, картинок: {done}, с ошибками: {failed}'
+        ))
@@ -0,0 +1,221 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from argparse import SUPPRESS
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from core import benchmark
+from posts.benchmarks import suite
+from posts.models import Post
+from posts.synthetic import EPOCH
+
+
+def benchmark_caches(directory):
+    """Кэш сайта (`core.cache.SQLiteCache`) в пустом файле в `directory`.
+
+    Замеры идут через тот же бэкенд, что и на сайте, но без данных,
+    оставшихся от запущенного сайта или прошлых прогонов.
+    """
+    return {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': os.path.join(directory, 'cache.sqlite3'),
+            'OPTIONS': {'MAX_BYTES': 256 * 1024 * 1024},
+        }
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет view, шаблоны и запросы постов на засеянных базах и '
+        'сравнивает с базовыми замерами; с --save сохраняет их'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', action='append', choices=list(settings.BENCHMARK_SIZES),
+            help='Размер базы, можно несколько раз; по умолчанию small',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=10, help='Раундов в каждом процессе',
+        )
+        parser.add_argument(
+            '--min-time', type=float, default=0.05,
+            help='Наименьшая длительность раунда в секундах',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=settings.BENCHMARK_THRESHOLD,
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=settings.BENCHMARK_ALPHA,
+        )
+        parser.add_argument(
+            '--only', help='Только бенчмарки, в имени которых есть строка',
+        )
+        parser.add_argument(
+            '--processes', type=int, default=3,
+            help='В скольких отдельных процессах повторить замеры',
+        )
+        parser.add_argument(
+            '--save', action='store_true',
+            help='Сохранить замеры как базовые',
+        )
+        # Замеры одного процесса в JSON, для родительского процесса.
+        parser.add_argument('--child', action='store_true', help=SUPPRESS)
+
+    @contextmanager
+    def seeded_database(self, size):
+        """Переключает соединение на базу размера `size`.
+
+        База создаётся и засевается `generate_data` один раз и дальше
+        переиспользуется, поэтому прогоны идут на одних и тех же данных.
+        """
+        os.makedirs(settings.BENCHMARK_DIR, exist_ok=True)
+        path = os.path.join(settings.BENCHMARK_DIR, f'{size}.sqlite3')
+        test_settings = connection.settings_dict['TEST']
+        old_name, old_test_name = connection.settings_dict['NAME'], (
+            test_settings['NAME']
+        )
+        test_settings['NAME'] = path
+        cache_directory = tempfile.mkdtemp()
+        try:
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False, keepdb=True
+            )
+            # Журнал запросов DEBUG не должен попадать в замеры.
+            with override_settings(
+                DEBUG=False, CACHES=benchmark_caches(cache_directory)
+            ):
+                if not Post.objects.exists():
+                    self.stdout.write(f'Засев базы {size}…')
+                    call_command(
+                        'generate_data', seed=1, end=EPOCH,
+                        stdout=StringIO(),
+                        **settings.BENCHMARK_SIZES[size],
+                    )
+                yield
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=True
+            )
+            test_settings['NAME'] = old_test_name
+            shutil.rmtree(cache_directory, ignore_errors=True)
+
+    def measure(self, size, options):
+        with self.seeded_database(size):
+            benchmarks = [
+                item for item in suite()
+                if not options['only'] or options['only'] in item.name
+            ]
+            return benchmark.run(
+                benchmarks, options['repeat'], options['min_time']
+            )
+
+    def measure_in_processes(self, size, options):
+        """Замеры из нескольких свежих процессов, раунды вместе.
+
+        От процесса к процессу время заметно плавает (раскладка памяти,
+        соль хэшей), поэтому раунды одного процесса похожи между собой
+        сильнее, чем на раунды следующего запуска. Общая выборка по
+        нескольким процессам делает сравнение честнее.
+        """
+        # Засев базы — один раз, до запуска процессов.
+        with self.seeded_database(size):
+            pass
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+            'benchmark', '--child',
+            '--size', size, '--repeat', str(options['repeat']),
+            '--min-time', str(options['min_time']),
+        ]
+        if options['only']:
+            command += ['--only', options['only']]
+        results = {}
+        processes = max(options['processes'], 1)
+        for number in range(processes):
+            self.stdout.write(
+                f'База {size}: процесс {number + 1} из {processes}'
+            )
+            output = subprocess.run(
+                command, check=True, stdout=subprocess.PIPE
+            ).stdout
+            for name, result in json.loads(output).items():
+                results.setdefault(name, []).extend(result['samples'])
+        results = {
+            name: {'median': benchmark.median(samples), 'samples': samples}
+            for name, samples in results.items()
+        }
+        for name, result in results.items():
+            self.stdout.write(f'  {name}: {result["median"] * 1000:.3f} мс')
+        return results
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(
+                self.measure(options['size'][0], options)
+            ))
+            return
+        regressions = []
+        for size in options['size'] or ['small']:
+            results = self.measure_in_processes(size, options)
+            path = os.path.join(settings.BENCHMARK_DIR, f'{size}.json')
+            if options['save']:
+                self.save(path, size, results)
+                continue
+            if not os.path.exists(path):
+                self.stdout.write(
+                    f'Базовых замеров для {size} нет, сохраните их с --save'
+                )
+                continue
+            with open(path) as file:
+                baseline = json.load(file)['results']
+            regressions.extend(
+                f'{size} {row["name"]}: {row["change"]:+.0%}'
+                for row in self.compare(baseline, results, options)
+            )
+        if regressions:
+            raise CommandError(
+                'Замедления относительно базовых замеров:\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def save(self, path, size, results):
+        with open(path, 'w') as file:
+            json.dump({
+                'size': size,
+                'created': datetime.now(timezone.utc).isoformat(),
+                'environment': benchmark.environment(),
+                'results': results,
+            }, file, indent=2)
+        self.stdout.write(f'Базовые замеры сохранены в {path}')
+
+    def compare(self, baseline, results, options):
+        """Печатает сравнение и возвращает строки замедлений."""
+        rows = benchmark.compare(
+            baseline, results, options['threshold'], options['alpha']
+        )
+        for row in rows:
+            if row['status'] == benchmark.NEW:
+                self.stdout.write(f'  {row["name"]}: новый замер')
+                continue
+            line = (
+                f'  {row["name"]}: {row["baseline"] * 1000:.3f} → '
+                f'{row["current"] * 1000:.3f} мс ({row["change"]:+.1%}, '
+                f'p={row["p_value"]:.3g}) {row["status"]}'
+            )
+            if row['status'] == benchmark.SLOWER:
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        return [row for row in rows if row['status'] == benchmark.SLOWER]
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts import garbage
+from posts.models import ImageBlob, image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов и миниатюры, на которые ничего не '
+        'ссылается; с --dry-run только показывает, что будет удалено'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--directory', default='posts')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age', type=float, default=24,
+            help='Не трогать файлы моложе стольких часов',
+        )
+
+    def remove(self, storage, name, size):
+        self.files += 1
+        self.bytes += size
+        if self.verbosity > 1:
+            self.stdout.write(name)
+        if not self.dry_run:
+            storage.delete(name)
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        chunk_size = options['chunk_size']
+        before = time.time() - options['min_age'] * 60 * 60
+        report = []
+
+        self.files = self.bytes = 0
+        for chunk in garbage.chunked(
+            garbage.orphan_images(options['directory'], before, chunk_size),
+            chunk_size,
+        ):
+            for name, size in chunk:
+                self.remove(image_storage, name, size)
+            if not self.dry_run:
+                ImageBlob.objects.filter(
+                    name__in=[name for name, _ in chunk]
+                ).delete()
+        report.append(('Картинки без постов', self.files, self.bytes))
+
+        self.files = self.bytes = 0
+        entries = 0
+        for keys, names in garbage.orphan_sources(chunk_size):
+            for name in names:
+                self.remove(
+                    default.storage, name,
+                    garbage.file_size(default.storage, name),
+                )
+            entries += len(keys)
+            if not self.dry_run:
+                default.kvstore._delete_raw(*keys)
+        report.append(('Миниатюры удалённых картинок', self.files, self.bytes))
+
+        self.files = self.bytes = 0
+        for name, size in garbage.stray_thumbnails(before, chunk_size):
+            self.remove(default.storage, name, size)
+        report.append(('Миниатюры вне хранилища sorl', self.files, self.bytes))
+
+        prefix = 'Будет удалено' if self.dry_run else 'Удалено'
+        for title, files, size in report:
+            self.stdout.write(f'{prefix}: {title}: {files} ({size} байт)')
+        self.stdout.write(f'{prefix} записей хранилища sorl: {entries}')
+        self.stdout.write(self.style.SUCCESS('Готово'))
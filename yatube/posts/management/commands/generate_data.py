@@ -0,0 +1,155 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import autocomplete, cache
+from posts.synthetic import Generator
+
+# Строки вставляются минуя модели и их сигналы: производные данные
+# пересчитываются командами обслуживания.
+DERIVED = (
+    'reconcile_author_stats',
+    'backfill_comment_stats',
+    'rebuild_timelines',
+    'rebuild_search_index',
+)
+
+
+def moment(value):
+    """Дата и время ISO 8601; без часового пояса — в TIME_ZONE."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками со степенным распределением '
+        'популярности'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного закона популярности',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить посты',
+        )
+        parser.add_argument(
+            '--end', type=moment,
+            help='Конец периода постов, например 2024-01-01T00:00; '
+                 'по умолчанию — текущий момент. С ним и --seed данные '
+                 'воспроизводятся',
+        )
+        parser.add_argument(
+            '--ungrouped', type=float, default=0.3,
+            help='Доля постов без группы',
+        )
+        parser.add_argument(
+            '--password',
+            help='Общий пароль пользователей; без него войти нельзя',
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересчитывать счётчики, ленты и поисковый индекс',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 and (
+            options['posts'] or options['comments'] or options['follows']
+        ):
+            self.stderr.write('Для постов и подписок нужны пользователи')
+            return
+        if options['posts'] < 1 and options['comments']:
+            self.stderr.write('Для комментариев нужны посты')
+            return
+        self.batch_size = options['batch_size']
+        self.started = time.monotonic()
+        generator = Generator(
+            seed=options['seed'],
+            skew=options['skew'],
+            days=options['days'],
+            ungrouped=options['ungrouped'],
+            password=options['password'],
+            end=options['end'],
+        )
+        if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+            # Пачка фиксируется без ожидания записи на диск: при сбое
+            # генерацию проще повторить на чистой базе.
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+
+        table = generator.start_users(options['users'])
+        self.numbered(
+            table, generator.users, generator.user_batch, 'пользователей'
+        )
+        table = generator.start_groups(options['groups'])
+        self.numbered(
+            table, generator.groups, generator.group_batch, 'групп'
+        )
+        table = generator.start_posts(options['posts'])
+        self.numbered(
+            table, generator.posts, generator.post_batch, 'постов'
+        )
+        self.counted(
+            generator.start_comments(), options['comments'],
+            generator.comment_batch, 'комментариев',
+        )
+        self.counted(
+            generator.start_follows(), options['follows'],
+            generator.follow_batch, 'подписок',
+        )
+
+        if options['skip_derived']:
+            self.stdout.write(
+                'Производные данные не пересчитаны, запустите: '
+                + ', '.join(DERIVED)
+            )
+        else:
+            for command in DERIVED:
+                self.stdout.write(f'Запуск {command}')
+                call_command(command, stdout=self.stdout)
+        cache.bump(cache.FEED, autocomplete.SCOPE)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - self.started:.0f} с'
+        ))
+
+    def insert(self, table, rows, label, done, total):
+        # Одна транзакция на пачку: прерванная генерация оставляет
+        # только целые пачки.
+        with transaction.atomic():
+            table.insert(rows)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f'Создано {label}: {done} из {total} ({elapsed:.0f} с)'
+        )
+
+    def numbered(self, table, objects, make_batch, label):
+        first, total = objects
+        for offset in range(0, total, self.batch_size):
+            size = min(self.batch_size, total - offset)
+            rows = make_batch(first + offset, size)
+            self.insert(table, rows, label, offset + size, total)
+
+    def counted(self, table, total, make_batch, label):
+        for offset in range(0, total, self.batch_size):
+            size = min(self.batch_size, total - offset)
+            rows = make_batch(size)
+            self.insert(table, rows, label, offset + size, total)
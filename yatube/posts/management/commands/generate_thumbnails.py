@@ -0,0 +1,48 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры картинок постов параллельно на всех ядрах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов (по умолчанию — число ядер)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--chunk-size', type=int, default=16)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').order_by('pk')
+        done = failed = 0
+        last_post = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = list(
+                    posts.filter(pk__gt=last_post)
+                    .values_list('pk', 'image')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_post = batch[-1][0]
+                # Дочерние процессы не должны унаследовать соединение.
+                connections.close_all()
+                results = pool.map(
+                    thumbnails.generate,
+                    [image for _, image in batch],
+                    chunksize=options['chunk_size'],
+                )
+                for ok in results:
+                    done += 1
+                    failed += not ok
+                self.stdout.write(f'Обработано картинок: {done}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, картинок: {done}, с ошибками: {failed}'
+        ))
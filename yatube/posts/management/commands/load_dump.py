@@ -0,0 +1,80 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.base import DeserializationError
+from django.db import IntegrityError
+
+from core import fixtures
+from posts import autocomplete, blobs, cache
+
+from .generate_data import DERIVED
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково загружает выгрузку dumpdata (JSON-массив или NDJSON, '
+        'можно .gz) пачками bulk_create без сигналов моделей, затем '
+        'пересчитывает производные данные'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--exclude', '-e', action='append', default=[],
+            help='Не загружать приложение или модель (app_label.Model)',
+        )
+        parser.add_argument(
+            '--ignore-conflicts', action='store_true',
+            help='Пропускать записи, чей ключ уже есть в базе',
+        )
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересчитывать счётчики, ленты и поисковый индекс',
+        )
+
+    def handle(self, *args, **options):
+        self.started = time.monotonic()
+        loader = fixtures.Loader(
+            batch_size=max(options['batch_size'], 1),
+            ignore_conflicts=options['ignore_conflicts'],
+            exclude=[label.lower() for label in options['exclude']],
+            progress=self.progress,
+        )
+        try:
+            with fixtures.open_dump(options['path']) as file:
+                elapsed = loader.load(fixtures.records(file))
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать выгрузку: {error}')
+        except (ValueError, DeserializationError, IntegrityError) as error:
+            raise CommandError(f'Ошибка в выгрузке: {error}')
+        total = sum(loader.processed.values())
+        self.stdout.write(
+            f'Обработано {total} записей за {elapsed:.1f} с, '
+            f'{total / max(elapsed, 1e-9):.0f} записей в секунду; '
+            f'добавлено {loader.inserted}, уже были в базе '
+            f'{total - loader.inserted}; исключено {loader.skipped}'
+        )
+
+        if options['skip_derived']:
+            self.stdout.write(
+                'Производные данные не пересчитаны, запустите: '
+                + ', '.join(DERIVED)
+            )
+        else:
+            for command in DERIVED:
+                self.stdout.write(f'Запуск {command}')
+                call_command(command, stdout=self.stdout)
+            blobs.recount()
+        cache.bump(cache.FEED, autocomplete.SCOPE)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - self.started:.0f} с'
+        ))
+
+    def progress(self, model, processed):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f'Обработано {model._meta.label_lower}: {processed} '
+            f'({processed / max(elapsed, 1e-9):.0f} в секунду)'
+        )
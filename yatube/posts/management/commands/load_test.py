@@ -0,0 +1,94 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import loadtest
+from posts.loadtest import Scenarios
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает WSGI-приложение в этом же процессе смесью сценариев и '
+        'выводит перцентили задержки, запросы в секунду и число '
+        'SQL-запросов по каждому view в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Число одновременных виртуальных пользователей',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность прогона в секундах',
+        )
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Исполнители в процессах, а не в потоках',
+        )
+        parser.add_argument(
+            '--anonymous', type=float, default=0.7,
+            help='Доля сценариев анонимного посетителя',
+        )
+        parser.add_argument(
+            '--pages', type=int, default=3,
+            help='Сколько страниц ленты листать самое большее',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Записать отчёт в файл, а не в вывод',
+        )
+
+    def handle(self, *args, **options):
+        from yatube.wsgi import application
+
+        scenarios = Scenarios(
+            anonymous_share=options['anonymous'],
+            pages=max(options['pages'], 1),
+            seed=options['seed'],
+        )
+        if not scenarios.post_ids:
+            raise CommandError(
+                'В базе нет постов: наполните её командой generate_data'
+            )
+        if settings.DEBUG:
+            self.stderr.write(
+                'DEBUG включён: запросы к базе копятся в памяти'
+            )
+        if settings.QUERY_BUDGET_ENABLED:
+            self.stderr.write(
+                'Проверка бюджетов запросов включена и добавляет задержку'
+            )
+        workers = [
+            scenarios.worker(number)
+            for number in range(max(options['concurrency'], 1))
+        ]
+        report = loadtest.run(
+            application, workers, options['duration'],
+            processes=options['processes'],
+        )
+        report['config'] = {
+            name: options[name] for name in (
+                'concurrency', 'duration', 'processes', 'anonymous', 'pages',
+                'seed',
+            )
+        }
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if not options['output']:
+            self.stdout.write(text)
+            return
+        with open(options['output'], 'w') as file:
+            file.write(text)
+        for name, endpoint in report['endpoints'].items():
+            latency = endpoint['latency_ms']
+            self.stdout.write(
+                f'{name}: {endpoint["requests"]} запросов, '
+                f'p50 {latency["p50"]} мс, p95 {latency["p95"]} мс, '
+                f'p99 {latency["p99"]} мс, '
+                f'SQL {endpoint["queries"]["mean"]}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {report["rps"]} запросов в секунду, '
+            f'ошибок {report["errors"]}, отчёт в {options["output"]}'
+        ))
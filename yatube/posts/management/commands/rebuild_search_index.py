@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('pk').values_list('pk', 'text')
+        done = 0
+        last_post = 0
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last_post)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_post = batch[-1][0]
+            with transaction.atomic():
+                search.index_many(batch)
+            done += len(batch)
+            self.stdout.write(f'Проиндексировано постов: {done}')
+        # Индекс переписывается поверх старого, так что поиск работает
+        # всё время перестройки; записи удалённых постов убираются в конце.
+        removed = search.prune()
+        search.optimize()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, постов в индексе: {done}, удалено записей: {removed}'
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пересобрать ленты только этих пользователей',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        users = Follow.objects.order_by('user').values_list(
+            'user', flat=True
+        ).distinct()
+        if options['usernames']:
+            users = users.filter(user__username__in=options['usernames'])
+        batch_size = options['batch_size']
+        rebuilt = 0
+        last_user = 0
+        while True:
+            batch = list(users.filter(user__gt=last_user)[:batch_size])
+            if not batch:
+                break
+            for user in batch:
+                timeline.rebuild(user)
+            rebuilt += len(batch)
+            last_user = batch[-1]
+            self.stdout.write(f'Пересобрано лент: {rebuilt}')
+        self.stdout.write(self.style.SUCCESS(f'Готово, лент: {rebuilt}'))
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import AuthorStats, Follow, Post
+from posts.stats import FIELDS
+
+User = get_user_model()
+
+
+def grouped_counts(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids})
+        .values_list(field)
+        .annotate(total=Count('pk'))
+        .order_by()
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает разошедшиеся счётчики авторов пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk').values_list('pk', flat=True)
+        batch_size = options['batch_size']
+        checked = fixed = 0
+        last_user = 0
+        while True:
+            ids = list(users.filter(pk__gt=last_user)[:batch_size])
+            if not ids:
+                break
+            fixed += self.reconcile(ids)
+            checked += len(ids)
+            last_user = ids[-1]
+            self.stdout.write(f'Проверено авторов: {checked}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, исправлено записей: {fixed}'
+        ))
+
+    def reconcile(self, ids):
+        posts = grouped_counts(Post.objects, 'author', ids)
+        followers = grouped_counts(Follow.objects, 'author', ids)
+        following = grouped_counts(Follow.objects, 'user', ids)
+        with transaction.atomic():
+            existing = AuthorStats.objects.select_for_update().in_bulk(ids)
+            drifted, missing = [], []
+            for pk in ids:
+                actual = AuthorStats(
+                    author_id=pk,
+                    posts_count=posts.get(pk, 0),
+                    followers_count=followers.get(pk, 0),
+                    following_count=following.get(pk, 0),
+                )
+                stored = existing.get(pk)
+                if stored is None:
+                    missing.append(actual)
+                elif any(
+                    getattr(stored, field) != getattr(actual, field)
+                    for field in FIELDS
+                ):
+                    drifted.append(actual)
+            AuthorStats.objects.bulk_create(missing)
+            AuthorStats.objects.bulk_update(drifted, FIELDS)
+        return len(drifted) + len(missing)
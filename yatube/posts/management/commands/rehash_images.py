@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import blobs, cache
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов на адреса по содержимому, объединяя '
+        'одинаковые файлы, и пересчитывает ссылки на них'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def relocate(self, batch):
+        """Кладёт файлы пачки на новые адреса: {старое имя: новое}."""
+        renamed = {}
+        for _, name, username, slug in batch:
+            if blobs.storage.is_hashed(name):
+                continue
+            if name not in renamed:
+                try:
+                    renamed[name] = blobs.storage.relocate(name)
+                except FileNotFoundError:
+                    self.missing += 1
+                    continue
+            self.scopes.add(cache.AUTHOR.format(username))
+            if slug:
+                self.scopes.add(cache.GROUP.format(slug))
+        return renamed
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').order_by('pk').values_list(
+            'pk', 'image', 'author__username', 'group__slug'
+        )
+        moved = self.missing = 0
+        self.scopes = set()
+        last_post = 0
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last_post)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_post = batch[-1][0]
+            renamed = self.relocate(batch)
+            with transaction.atomic():
+                for old, new in renamed.items():
+                    Post.objects.filter(image=old).update(image=new)
+            # Старые файлы удаляются, только когда на них нет ссылок.
+            for old in renamed:
+                blobs.storage.delete(old)
+            moved += len(renamed)
+            self.stdout.write(f'Перенесено файлов: {moved}')
+        blobs.recount()
+        if moved:
+            cache.bump(cache.FEED, *self.scopes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, перенесено: {moved}, не найдено: {self.missing}'
+        ))
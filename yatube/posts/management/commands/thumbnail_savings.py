@@ -0,0 +1,88 @@
+import json
+from collections import Counter
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.parsers import parse_geometry
+
+from posts import thumbnails
+from posts.models import image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает объём вариантов WebP/AVIF с JPEG-миниатюрой карточки '
+        'на картинках из media/posts/ (файлы миниатюр не сохраняются)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default='posts')
+        parser.add_argument(
+            '--limit', type=int, help='Взять не больше стольких картинок'
+        )
+        parser.add_argument(
+            '--json', action='store_true', help='Вывести итоги в JSON'
+        )
+
+    def encode(self, source, image, geometry, options):
+        options = thumbnails.thumbnail_options(source, options)
+        geometry = parse_geometry(
+            geometry, default.engine.get_image_ratio(image, options)
+        )
+        thumbnail = default.engine.create(image, geometry, options)
+        return len(default.engine._get_raw_data(
+            thumbnail, options['format'], options['quality'],
+            image_info=default.engine.get_image_info(image),
+            progressive=options.get('progressive', True),
+        ))
+
+    def walk(self, directory):
+        """Имена файлов каталога хранилища вместе с вложенными."""
+        directories, files = image_storage.listdir(directory)
+        for name in sorted(files):
+            yield f'{directory}/{name}'
+        for name in sorted(directories):
+            yield from self.walk(f'{directory}/{name}')
+
+    def handle(self, *args, **options):
+        names = islice(self.walk(options['directory']), options['limit'])
+        totals = Counter()
+        images = failed = 0
+        for name in names:
+            source = ImageFile(name, image_storage)
+            try:
+                image = default.engine.get_image(source)
+            except Exception:
+                failed += 1
+                continue
+            images += 1
+            totals['original'] += image_storage.size(name)
+            totals['card'] += self.encode(
+                source, image, *thumbnails.CARD_GEOMETRY
+            )
+            for format_, _, width, geometry in thumbnails.VARIANTS:
+                totals[f'{format_.lower()}_{width}w'] += self.encode(
+                    source, image, *geometry
+                )
+        report = {
+            'images': images,
+            'failed': failed,
+            'bytes': dict(totals),
+            'savings_vs_card': {
+                variant: round(1 - size / totals['card'], 4)
+                for variant, size in totals.items()
+                if variant not in ('original', 'card')
+            } if totals['card'] else {},
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        self.stdout.write(f'Картинок: {images}, не прочитано: {failed}')
+        for variant, size in totals.items():
+            saving = report['savings_vs_card'].get(variant)
+            line = f'{variant}: {size} байт'
+            if saving is not None:
+                line += f', экономия к JPEG карточки {saving:.1%}'
+            self.stdout.write(line)
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_authorstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='комментариев'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='last_commented_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='последний комментарий'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_imageblob'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+                "text, tokenize='unicode61 remove_diacritics 2', "
+                "prefix='3 4')",
+                "INSERT INTO posts_post_fts (rowid, text) "
+                "SELECT id, replace(replace(text, 'ё', 'е'), 'Ё', 'Е') "
+                "FROM posts_post",
+            ],
+            reverse_sql=['DROP TABLE posts_post_fts'],
+        ),
+    ]
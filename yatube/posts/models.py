@@ -2,7 +2,10 @@ from django.contrib.auth import get_user_model
 from django.db import models
 from django.db.models.deletion import CASCADE
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
+image_storage = ContentAddressedStorage()
 
 
 class Group(models.Model):
@@ -20,6 +23,7 @@ class Post(models.Model):
         help_text='Введите текст поста'
     )
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField('изменён', auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -37,13 +41,50 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=image_storage,
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        'ширина картинки', null=True, blank=True, editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'высота картинки', null=True, blank=True, editable=False
+    )
+    image_color = models.CharField(
+        'цвет картинки', max_length=7, blank=True, editable=False
+    )
+    image_placeholder = models.TextField(
+        'заглушка картинки', blank=True, editable=False
+    )
+    comment_count = models.PositiveIntegerField(
+        'комментариев',
+        default=0,
+        editable=False,
+    )
+    last_commented_at = models.DateTimeField(
+        'последний комментарий',
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Каждая лента — диапазон одного индекса, пройденный с конца.
+        # id входит в индекс SQLite неявно и по возрастанию, поэтому сами
+        # даты тоже по возрастанию: обратный обход даёт (-pub_date, -id).
+        indexes = (
+            models.Index(fields=('pub_date',), name='post_date_idx'),
+            models.Index(
+                fields=('group', 'pub_date'), name='post_group_date_idx'
+            ),
+            models.Index(
+                fields=('author', 'pub_date'), name='post_author_date_idx'
+            ),
+        )
 
     def __str__(self):
         return self.text[:15]
@@ -66,6 +107,14 @@ class Comment(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        ordering = ('created',)
+        indexes = (
+            models.Index(
+                fields=('post', 'created'), name='comment_post_created_idx'
+            ),
+        )
+
     def __str__(self):
         return f'Пост: {self.post}, Автор: {self.author} - {self.text}'
 
@@ -82,5 +131,74 @@ class Follow(models.Model):
         related_name='following',
     )
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'), name='unique_follow'
+            ),
+        )
+
     def __str__(self):
         return f'Автор: {self.author} Фоловер:{self.user}'
+
+
+class TimelineEntry(models.Model):
+    """Запись персональной ленты подписок (fan-out при публикации)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_timeline_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', 'pub_date', 'post'),
+                name='timeline_user_date_post_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'Лента {self.user}: {self.post}'
+
+
+class AuthorStats(models.Model):
+    """Счётчики автора, поддерживаемые при изменении постов и подписок."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField('постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'подписчиков', default=0, db_index=True
+    )
+    following_count = models.PositiveIntegerField('подписок', default=0)
+
+    def __str__(self):
+        return f'Статистика {self.author}'
+
+
+class ImageBlob(models.Model):
+    """Число постов, ссылающихся на файл картинки в хранилище.
+
+    Одинаковые картинки хранятся одним файлом; файл удаляется, когда
+    на него не остаётся ссылок.
+    """
+    name = models.CharField('файл', max_length=100, primary_key=True)
+    references = models.PositiveIntegerField('ссылок', default=0)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,158 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def is_pk(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def pack_cursor(direction, position):
+    """Упаковывает направление и позицию в непрозрачный токен."""
+    payload = json.dumps([direction, *position], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def unpack_cursor(cursor):
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        payload = base64.urlsafe_b64decode(cursor + padding)
+        direction, *position = json.loads(payload.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if direction not in (NEXT, PREVIOUS):
+        raise InvalidCursor(cursor)
+    return direction, position
+
+
+def decode_cursor(cursor):
+    direction, position = unpack_cursor(cursor)
+    return direction, CursorPaginator.decode_position(position)
+
+
+class CursorPage(Page):
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.encode_cursor(NEXT, self.object_list[-1])
+        return None
+
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.encode_cursor(
+                PREVIOUS, self.object_list[0]
+            )
+        return None
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id): без COUNT(*) и OFFSET.
+
+    Позиция страницы задаётся последней показанной записью, поэтому
+    новые посты, добавленные во время листания, не сдвигают страницы.
+    """
+
+    ordering = ('-pub_date', '-pk')
+
+    def __init__(self, object_list, per_page):
+        super().__init__(object_list.order_by(*self.ordering), per_page)
+
+    @staticmethod
+    def encode_position(post):
+        return [post.pub_date.isoformat(), post.pk]
+
+    @staticmethod
+    def decode_position(position):
+        try:
+            pub_date, pk = position
+        except ValueError:
+            raise InvalidCursor(position)
+        if not isinstance(pub_date, str) or not is_pk(pk):
+            raise InvalidCursor(position)
+        try:
+            # Дата может быть правильной по форме, но невозможной.
+            pub_date = parse_datetime(pub_date)
+        except (ValueError, TypeError):
+            raise InvalidCursor(position)
+        if pub_date is None:
+            raise InvalidCursor(position)
+        return pub_date, pk
+
+    def after(self, posts, position):
+        """Записи, идущие в порядке выдачи после позиции."""
+        pub_date, pk = position
+        return posts.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+        )
+
+    def before(self, posts, position):
+        pub_date, pk = position
+        return posts.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+        )
+
+    def encode_cursor(self, direction, post):
+        """Упаковывает позицию поста в непрозрачный токен."""
+        return pack_cursor(direction, self.encode_position(post))
+
+    def get_page(self, cursor):
+        """Возвращает страницу по токену, при ошибке — первую."""
+        if cursor:
+            try:
+                direction, position = unpack_cursor(cursor)
+                return self.cursor_page(
+                    direction, self.decode_position(position)
+                )
+            except InvalidCursor:
+                pass
+        return self.cursor_page(NEXT, None)
+
+    def cursor_page(self, direction, position):
+        posts = self.object_list
+        if direction == PREVIOUS:
+            posts = self.before(posts, position).reverse()
+        elif position is not None:
+            posts = self.after(posts, position)
+        posts = list(posts[:self.per_page + 1])
+        has_more = len(posts) > self.per_page
+        posts = posts[:self.per_page]
+        if direction == PREVIOUS:
+            posts.reverse()
+            return CursorPage(posts, self, True, has_more)
+        return CursorPage(posts, self, has_more, position is not None)
+
+
+def paginate(request, posts, cursor_paginator=CursorPaginator):
+    """Страница ленты: по курсору или по номеру, в зависимости от настроек."""
+    if settings.POSTS_CURSOR_PAGINATION:
+        paginator = cursor_paginator(posts, settings.OBJECTS_PER_PAGE)
+        return paginator.get_page(request.GET.get('cursor'))
+    paginator = Paginator(posts, settings.OBJECTS_PER_PAGE)
+    return paginator.get_page(request.GET.get('page'))
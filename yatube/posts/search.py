@@ -0,0 +1,153 @@
+"""Полнотекстовый поиск по постам.
+
+Текст постов лежит в виртуальной таблице SQLite FTS5 (обратный индекс),
+строка которой имеет rowid поста. Индекс обновляют сигналы сохранения и
+удаления поста, целиком его перестраивает команда `rebuild_search_index`.
+
+Токенизатор unicode61 приводит кириллицу к нижнему регистру, но не
+знает русской морфологии и не отождествляет «ё» и «е». Поэтому «ё»
+заменяется на «е» и в тексте, и в запросе, а у слов запроса отсекаются
+типичные окончания и ищется основа как префикс: «котами» найдёт «кот»,
+«коты» и «котов».
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .paginator import CursorPaginator, InvalidCursor, is_pk
+
+TABLE = 'posts_post_fts'
+WORD = re.compile(r'\w+')
+ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю',
+    'ом', 'ем', 'ах', 'ях', 'ов', 'ев', 'ам', 'ям', 'ть', 'ет', 'ют', 'ут',
+    'ит', 'ат', 'ят', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM = 3
+MAX_TERMS = 16
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def stem(word):
+    """Основа слова без типичного русского окончания."""
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def match_query(text):
+    """Запрос FTS5 из строки пользователя или None, если искать нечего.
+
+    Все слова обязательны; каждое берётся в кавычки, так что операторы
+    FTS5 из ввода не интерпретируются.
+    """
+    terms = [stem(word) for word in WORD.findall(normalize(text))]
+    terms = list(dict.fromkeys(terms))[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def index(post):
+    """Добавляет пост в индекс или заменяет устаревшую запись."""
+    index_many([(post.pk, post.text)])
+
+
+def remove(post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def prune():
+    """Убирает из индекса записи удалённых постов."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} '
+            f'WHERE rowid NOT IN (SELECT id FROM posts_post)'
+        )
+        return cursor.rowcount
+
+
+def index_many(rows):
+    """Добавляет в индекс пачку (id, текст), заменяя прежние записи."""
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {TABLE} (rowid, text) VALUES (%s, %s)',
+            [(pk, normalize(text)) for pk, text in rows],
+        )
+
+
+def optimize():
+    """Сливает сегменты индекса в один после массовой записи."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+
+
+def matching(posts, query):
+    """Посты выборки, подходящие под запрос FTS5, в исходном порядке."""
+    return posts.extra(
+        where=[
+            f'{Post._meta.db_table}.id IN '
+            f'(SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)'
+        ],
+        params=[query],
+    )
+
+
+def search(query, posts=None):
+    """Посты по запросу FTS5 с релевантностью `rank` (меньше — лучше)."""
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.extra(
+        tables=[TABLE],
+        where=[
+            f'{TABLE}.rowid = {Post._meta.db_table}.id', f'{TABLE} MATCH %s'
+        ],
+        params=[query],
+    ).annotate(
+        rank=RawSQL(f'{TABLE}.rank', (), output_field=FloatField())
+    )
+
+
+class SearchPaginator(CursorPaginator):
+    """Пагинатор результатов поиска по ключу (rank, id).
+
+    Релевантность зависит от всего корпуса, поэтому новые посты могут
+    слегка сдвинуть границы страниц, но не приводят к повторам внутри
+    одной выдачи так, как OFFSET.
+    """
+
+    ordering = ('rank', 'pk')
+
+    @staticmethod
+    def encode_position(post):
+        return [post.rank, post.pk]
+
+    @staticmethod
+    def decode_position(position):
+        try:
+            rank, pk = position
+        except ValueError:
+            raise InvalidCursor(position)
+        if (
+            not isinstance(rank, (int, float)) or isinstance(rank, bool)
+            or not is_pk(pk)
+        ):
+            raise InvalidCursor(position)
+        return float(rank), pk
+
+    def after(self, posts, position):
+        rank, pk = position
+        return posts.filter(Q(rank__gt=rank) | Q(rank=rank, pk__gt=pk))
+
+    def before(self, posts, position):
+        rank, pk = position
+        return posts.filter(Q(rank__lt=rank) | Q(rank=rank, pk__lt=pk))
@@ -0,0 +1,168 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import autocomplete, blobs, cache, search, stats, timeline
+from .models import Comment, Follow, Group, Post, User
+
+AUTOCOMPLETE_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        stats.change(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    stats.change(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timeline.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        stats.change(instance.author_id, followers_count=1)
+        stats.change(instance.user_id, following_count=1)
+
+
+@receiver(post_save, sender=Follow)
+def promote_followed_author(sender, instance, created, raw, **kwargs):
+    # После пересчёта счётчиков: решает число подписчиков с этой подпиской.
+    if created and not raw:
+        timeline.promote(instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    stats.change(instance.author_id, followers_count=-1)
+    stats.change(instance.user_id, following_count=-1)
+
+
+@receiver(post_delete, sender=Follow)
+def demote_unfollowed_author(sender, instance, **kwargs):
+    # После пересчёта счётчиков: решает число подписчиков без этой подписки.
+    timeline.demote(instance.author_id)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        stats.comment_added(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    stats.comment_removed(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, raw, **kwargs):
+    instance._previous_group = instance._previous_image = None
+    if instance.pk and not raw:
+        instance._previous_group, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group__slug', 'image'
+            ).first() or (None, None)
+        )
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, raw, **kwargs):
+    previous = getattr(instance, '_previous_image', None)
+    if not raw and instance.image.name != previous:
+        blobs.acquire(instance.image.name)
+        blobs.release(previous)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    blobs.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw, **kwargs):
+    if not raw:
+        search.index(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    search.remove(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post(sender, instance, raw, **kwargs):
+    if not raw:
+        cache.bump_post(instance, getattr(instance, '_previous_group', None))
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    cache.bump_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_post(sender, instance, raw=False, **kwargs):
+    post = Post.objects.select_related('author', 'group').filter(
+        pk=instance.post_id
+    ).first()
+    if post is not None and not raw:
+        cache.bump_post(post)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_followed_author(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache.bump(cache.AUTHOR.format(instance.author.username))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache.bump(cache.GROUP.format(instance.slug))
+
+
+@receiver(post_save, sender=User)
+def complete_saved_user(sender, instance, raw, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login.
+    if raw or (
+        update_fields and not AUTOCOMPLETE_USER_FIELDS & set(update_fields)
+    ):
+        return
+    autocomplete.user_changed(instance)
+
+
+@receiver(post_delete, sender=User)
+def complete_deleted_user(sender, instance, **kwargs):
+    autocomplete.user_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def complete_saved_group(sender, instance, raw, **kwargs):
+    if not raw:
+        autocomplete.group_changed(instance)
+
+
+@receiver(post_delete, sender=Group)
+def complete_deleted_group(sender, instance, **kwargs):
+    autocomplete.group_deleted(instance.pk)
@@ -0,0 +1,82 @@
+"""Денормализованные счётчики вместо COUNT(*) на каждый запрос."""
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+
+from .models import AuthorStats, Comment, Follow, Post
+
+FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+def count(author_id):
+    """Считает счётчики автора по исходным таблицам."""
+    return {
+        'posts_count': Post.objects.filter(author=author_id).count(),
+        'followers_count': Follow.objects.filter(author=author_id).count(),
+        'following_count': Follow.objects.filter(user=author_id).count(),
+    }
+
+
+def recompute(author_id):
+    stats, _ = AuthorStats.objects.update_or_create(
+        author_id=author_id, defaults=count(author_id)
+    )
+    return stats
+
+
+def get_stats(author_id):
+    """Счётчики автора; отсутствующая запись создаётся по факту."""
+    try:
+        return AuthorStats.objects.get(author_id=author_id)
+    except AuthorStats.DoesNotExist:
+        return recompute(author_id)
+
+
+def change(author_id, **deltas):
+    """Сдвигает счётчики автора на `deltas`.
+
+    Если записи ещё нет, она создаётся пересчётом, но только при росте
+    счётчиков: при каскадном удалении пользователя создавать её нельзя.
+    Счётчик, который ушёл бы ниже нуля, разошёлся с данными (например,
+    после загрузки без сигналов), поэтому запись тогда пересчитывается.
+    """
+    stats = AuthorStats.objects.filter(author_id=author_id)
+    with transaction.atomic():
+        updated = stats.filter(**{
+            f'{field}__gte': -delta
+            for field, delta in deltas.items() if delta < 0
+        }).update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        if updated:
+            return
+        if stats.exists() or all(delta > 0 for delta in deltas.values()):
+            recompute(author_id)
+
+
+def last_comment_date():
+    """Подзапрос даты последнего комментария к посту."""
+    return Subquery(
+        Comment.objects.filter(post=OuterRef('pk'))
+        .order_by('-created').values('created')[:1]
+    )
+
+
+def comment_added(comment):
+    Post.objects.filter(pk=comment.post_id).update(
+        comment_count=F('comment_count') + 1,
+        last_commented_at=comment.created,
+    )
+
+
+def comment_removed(comment):
+    posts = Post.objects.filter(pk=comment.post_id)
+    updated = posts.filter(comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1,
+        last_commented_at=last_comment_date(),
+    )
+    if not updated:
+        # Счётчик уже разошёлся с данными: пересчитываем.
+        posts.update(
+            comment_count=Comment.objects.filter(post=comment.post_id).count(),
+            last_commented_at=last_comment_date(),
+        )
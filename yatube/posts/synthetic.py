@@ -0,0 +1,261 @@
+"""Синтетические данные для нагрузочных прогонов.
+
+Популярность подчиняется степенному закону: немногие авторы пишут и
+собирают подписчиков больше всех остальных вместе, немногие группы
+собирают большую часть постов, свежие посты комментируют чаще старых.
+Номер по такому распределению берётся обращением функции распределения
+за O(1), без массивов весов, поэтому память не зависит от объёма.
+
+Пользователи, группы и посты получают первичные ключи подряд от
+текущего максимума, поэтому ссылки на них вычисляются по номерам без
+чтения из базы. Даты постов растут вместе с id, как у настоящих, и
+равномерно покрывают период, заканчивающийся в `end`.
+
+Данные зависят только от параметров генератора: одинаковые `seed` и
+`end` на пустой базе дают те же строки с теми же ключами. На непустой
+базе ключи (и имена пользователей и групп, в которые они входят)
+сдвигаются на текущий максимум, связи между строками остаются теми же.
+"""
+import random
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, models
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Comment, Follow, Group, Post, User
+
+FIRST_NAMES = (
+    'Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Ирина', 'Светлана',
+    'Алёна', 'Дарья', 'Ксения', 'Иван', 'Алексей', 'Сергей', 'Дмитрий',
+    'Андрей', 'Михаил', 'Николай', 'Павел', 'Артём', 'Фёдор',
+)
+LAST_NAMES = (
+    ('Иванов', 'ivanov'), ('Смирнов', 'smirnov'), ('Кузнецов', 'kuznetsov'),
+    ('Попов', 'popov'), ('Васильев', 'vasiliev'), ('Петров', 'petrov'),
+    ('Соколов', 'sokolov'), ('Михайлов', 'mikhailov'),
+    ('Новиков', 'novikov'), ('Фёдоров', 'fedorov'), ('Морозов', 'morozov'),
+    ('Волков', 'volkov'), ('Алексеев', 'alekseev'), ('Лебедев', 'lebedev'),
+    ('Семёнов', 'semenov'), ('Егоров', 'egorov'), ('Павлов', 'pavlov'),
+    ('Козлов', 'kozlov'), ('Степанов', 'stepanov'), ('Орлов', 'orlov'),
+)
+# Слова в порядке убывания частоты: выбираются по тому же закону.
+WORDS = (
+    'и', 'в', 'не', 'на', 'что', 'я', 'с', 'это', 'как', 'мы', 'день',
+    'город', 'кот', 'дом', 'сегодня', 'утром', 'снова', 'очень', 'новый',
+    'книга', 'дорога', 'море', 'лес', 'весна', 'осень', 'друзья', 'работа',
+    'проект', 'фотография', 'прогулка', 'кофе', 'вечер', 'музыка', 'поезд',
+    'река', 'небо', 'дождь', 'солнце', 'выставка', 'концерт', 'рецепт',
+    'пирог', 'сад', 'велосипед', 'горы', 'север', 'зима', 'снег', 'ёлка',
+    'библиотека', 'театр', 'история', 'письмо', 'собака', 'мост', 'парк',
+    'остров', 'маяк', 'туман', 'гроза', 'звёзды', 'тишина', 'путешествие',
+)
+GROUP_TOPICS = (
+    'Путешествия', 'Кулинария', 'Книги', 'Кино', 'Музыка', 'Фотография',
+    'Спорт', 'Сад и огород', 'Кошки', 'Собаки', 'Программирование',
+    'История', 'Театр', 'Велоспорт', 'Горы', 'Рыбалка', 'Настольные игры',
+    'Архитектура', 'Наука', 'Рукоделие',
+)
+SENTENCES = 4096
+# Конец периода по умолчанию для воспроизводимых наборов (бенчмарки).
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def power_law_index(rng, size, exponent):
+    """Номер от 0 до `size - 1`, малые номера вероятнее.
+
+    Обращение функции распределения непрерывного закона x ** -exponent
+    на [1, size + 1): вероятность номера k убывает примерно как
+    (k + 1) ** -exponent.
+    """
+    u = rng.random()
+    if exponent == 1:
+        x = (size + 1) ** u
+    else:
+        power = 1 - exponent
+        x = (((size + 1) ** power - 1) * u + 1) ** (1 / power)
+    return min(int(x) - 1, size - 1)
+
+
+def next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+class Table:
+    """Вставка готовых строк в таблицу модели одним `executemany`.
+
+    `bulk_create` тратит большую часть времени на подготовку каждого
+    значения полем модели; здесь значения уже в виде для базы, а столбцы,
+    которых нет в `fields`, получают умолчания полей, подготовленные один
+    раз.
+    """
+
+    def __init__(self, model, fields, ignore_conflicts=False):
+        self.model = model
+        rest = [
+            field for field in model._meta.concrete_fields
+            if field.name not in fields
+            and not isinstance(field, models.AutoField)
+        ]
+        self.defaults = tuple(
+            field.get_db_prep_save(field.get_default(), connection)
+            for field in rest
+        )
+        columns = [model._meta.get_field(name).column for name in fields]
+        columns += [field.column for field in rest]
+        quote = connection.ops.quote_name
+        self.sql = (
+            f'{connection.ops.insert_statement(ignore_conflicts)} '
+            f'{quote(model._meta.db_table)} '
+            f'({", ".join(map(quote, columns))}) '
+            f'VALUES ({", ".join(["%s"] * len(columns))})'
+        )
+
+    def insert(self, rows):
+        defaults = self.defaults
+        with connection.cursor() as cursor:
+            cursor.executemany(self.sql, [row + defaults for row in rows])
+
+
+class Generator:
+    """Порождает пачки строк; одинаковые `seed` и `end` дают те же данные.
+
+    Без `end` период заканчивается текущим моментом.
+
+    Порядок вызовов важен: посты ссылаются на созданных раньше
+    пользователей и группы, комментарии — на посты.
+    """
+
+    def __init__(self, seed=0, skew=1.1, days=365, ungrouped=0.3,
+                 password=None, end=None):
+        self.rng = random.Random(seed)
+        self.skew = skew
+        self.ungrouped = ungrouped
+        self.end = end or timezone.now()
+        self.start = self.end - timedelta(days=days)
+        self.password = make_password(password)
+        self.adapt_date = connection.ops.adapt_datetimefield_value
+        self.users = self.groups = self.posts = (0, 0)
+        self.sentences = [self.sentence() for _ in range(SENTENCES)]
+
+    def pick(self, objects):
+        first, total = objects
+        return first + power_law_index(self.rng, total, self.skew)
+
+    def word(self):
+        return WORDS[power_law_index(self.rng, len(WORDS), self.skew)]
+
+    def sentence(self):
+        words = [self.word() for _ in range(self.rng.randint(3, 14))]
+        return ' '.join(words).capitalize() + '.'
+
+    def text(self):
+        # Длины постов логнормальны: много коротких, редкие длинные.
+        length = min(max(int(self.rng.lognormvariate(0.8, 0.9)), 1), 60)
+        return ' '.join(self.rng.choices(self.sentences, k=length))
+
+    def post_date(self, number):
+        """Дата поста с номером `number` без разброса."""
+        first, total = self.posts
+        return self.start + (self.end - self.start) * (
+            (number - first) / max(total, 1)
+        )
+
+    def start_users(self, total):
+        self.users = (next_pk(User), total)
+        return Table(User, (
+            'id', 'username', 'first_name', 'last_name', 'password',
+            'date_joined',
+        ))
+
+    def user_batch(self, first, size):
+        batch = []
+        joined = self.adapt_date(self.start)
+        for pk in range(first, first + size):
+            last_name, login = self.rng.choice(LAST_NAMES)
+            first_name = self.rng.choice(FIRST_NAMES)
+            if first_name.endswith(('а', 'я')):
+                last_name += 'а'
+            batch.append((
+                pk, f'{login}_{pk}', first_name, last_name, self.password,
+                joined,
+            ))
+        return batch
+
+    def start_groups(self, total):
+        self.groups = (next_pk(Group), total)
+        return Table(Group, ('id', 'title', 'slug', 'description'))
+
+    def group_batch(self, first, size):
+        return [
+            (
+                pk,
+                f'{self.rng.choice(GROUP_TOPICS)} {pk}',
+                f'group-{pk}',
+                self.sentence(),
+            )
+            for pk in range(first, first + size)
+        ]
+
+    def start_posts(self, total):
+        self.posts = (next_pk(Post), total)
+        return Table(Post, (
+            'id', 'author', 'group', 'text', 'pub_date', 'updated',
+        ))
+
+    def post_batch(self, first, size):
+        batch = []
+        step = (self.end - self.start) / max(self.posts[1], 1)
+        for pk in range(first, first + size):
+            group = None
+            if self.groups[1] and self.rng.random() >= self.ungrouped:
+                group = self.pick(self.groups)
+            pub_date = self.adapt_date(
+                self.post_date(pk) + step * self.rng.random()
+            )
+            batch.append((
+                pk, self.pick(self.users), group, self.text(), pub_date,
+                pub_date,
+            ))
+        return batch
+
+    def start_comments(self):
+        return Table(Comment, ('post', 'author', 'text', 'created'))
+
+    def comment_batch(self, size):
+        batch = []
+        first, total = self.posts
+        for _ in range(size):
+            # Свежие посты комментируют чаще: номер считается от конца.
+            post = first + total - 1 - power_law_index(
+                self.rng, total, self.skew
+            )
+            # Конец интервала поста, чтобы комментарий не опередил его.
+            posted = self.post_date(post + 1)
+            # Большинство комментариев приходит вскоре после поста.
+            created = posted + (self.end - posted) * self.rng.random() ** 4
+            batch.append((
+                post, self.pick(self.users), self.sentence(),
+                self.adapt_date(created),
+            ))
+        return batch
+
+    def start_follows(self):
+        # Повторные пары отбрасывает уникальность (user, author).
+        return Table(Follow, ('user', 'author'), ignore_conflicts=True)
+
+    def follow_batch(self, size):
+        """Подписки: на популярных авторов, от случайных читателей.
+
+        Повторы и подписки на себя отбрасываются, поэтому подписок может
+        выйти чуть меньше `size`.
+        """
+        first, total = self.users
+        pairs = set()
+        for _ in range(size):
+            user = first + self.rng.randrange(total)
+            author = self.pick(self.users)
+            if user != author:
+                pairs.add((user, author))
+        return sorted(pairs)
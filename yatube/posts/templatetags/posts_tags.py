@@ -0,0 +1,38 @@
+from django import template
+
+from posts import thumbnails
+from posts.cards import render_cards
+from posts.models import Follow
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def is_following(context, username):
+    """Подписан ли текущий пользователь на автора."""
+    user = context['request'].user
+    return user.is_authenticated and Follow.objects.filter(
+        user=user, author__username=username
+    ).exists()
+
+
+@register.simple_tag
+def post_cards(posts, template_name):
+    """Карточки постов страницы из кэша: `{% for post, card in cards %}`."""
+    return render_cards(posts, template_name)
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post):
+    """Картинка поста с вариантами для `srcset` и заглушкой.
+
+    Размеры — у миниатюры карточки, поэтому место под картинку известно
+    заранее; заглушка берётся из полей поста, файл не открывается.
+    """
+    if not hasattr(post, 'thumbnail_sources'):
+        thumbnails.prefetch([post])
+    return {
+        'post': post,
+        'width': thumbnails.CARD_WIDTH,
+        'height': thumbnails.CARD_HEIGHT,
+    }
@@ -0,0 +1,354 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db.models import Count, F
+from django.test import TestCase, override_settings
+
+from core.benchmark import run
+from core.cache import SQLiteCache
+
+from .. import benchmarks, search, synthetic, views
+from ..management.commands.benchmark import benchmark_caches
+from ..models import (
+    AuthorStats, Comment, Follow, Group, Post, TimelineEntry,
+)
+
+User = get_user_model()
+
+
+class SyntheticDataTests(TestCase):
+    options = dict(
+        users=40, groups=5, posts=300, comments=200, follows=150,
+        batch_size=64, seed=7, end=synthetic.EPOCH, stdout=StringIO(),
+    )
+
+    def snapshot(self):
+        return (
+            list(User.objects.values_list('username', 'last_name')),
+            list(Post.objects.values_list(
+                'author', 'group', 'text', 'pub_date'
+            )),
+            list(Comment.objects.values_list(
+                'post', 'author', 'text', 'created'
+            )),
+            list(Follow.objects.values_list('user', 'author')),
+        )
+
+    def test_generate_data_command(self):
+        """generate_data создаёт связные данные с перекосом популярности"""
+        call_command('generate_data', **self.options)
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Group.objects.count(), 5)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertTrue(100 < Follow.objects.count() <= 150)
+        self.assertFalse(Follow.objects.filter(user=F('author')))
+        authors = list(
+            Post.objects.values_list('author').annotate(total=Count('pk'))
+            .order_by('-total').values_list('total', flat=True)
+        )
+        self.assertGreater(authors[0], 10 * authors[len(authors) // 2])
+        self.assertFalse(
+            Comment.objects.filter(created__lt=F('post__pub_date'))
+        )
+        ordered = list(Post.objects.order_by('pk').values_list(
+            'pub_date', flat=True
+        ))
+        self.assertEqual(ordered, sorted(ordered))
+        self.assertLessEqual(ordered[-1], synthetic.EPOCH)
+        self.assertLessEqual(
+            Comment.objects.latest('created').created, synthetic.EPOCH
+        )
+        post = Post.objects.annotate(total=Count('comments')).latest('pk')
+        self.assertEqual(post.comment_count, post.total)
+        self.assertEqual(
+            AuthorStats.objects.get(author=post.author).posts_count,
+            post.author.posts.count(),
+        )
+        self.assertTrue(TimelineEntry.objects.exists())
+        word = post.text.split()[-1].strip('.')
+        self.assertIn(post, search.matching(
+            Post.objects.all(), search.match_query(word)
+        ))
+
+    def test_same_seed_same_data(self):
+        """Одинаковые seed и end дают одинаковые данные"""
+        call_command('generate_data', **self.options)
+        first = self.snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        options = dict(self.options)
+        del options['end']
+        # Дата без часового пояса из командной строки — в TIME_ZONE (UTC).
+        call_command('generate_data', '--end', '2024-01-01T00:00', **options)
+        self.assertEqual(self.snapshot(), first)
+
+
+class LoadTestCommandTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.other = User.objects.create_user(username='other')
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(15):
+            Post.objects.create(
+                author=(cls.author, cls.other)[number % 2], group=cls.group,
+                text=f'Пост {number}',
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_load_test_command(self):
+        """load_test выдаёт перцентили и число запросов по каждому view"""
+        out = StringIO()
+        call_command(
+            'load_test', concurrency=1, duration=0.5, anonymous=0.5,
+            stdout=out, stderr=StringIO(),
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['config']['concurrency'], 1)
+        self.assertGreater(report['rps'], 0)
+        index = report['endpoints']['posts:index']
+        self.assertEqual(
+            set(index['latency_ms']), {'p50', 'p95', 'p99', 'mean', 'max'}
+        )
+        self.assertIn('queries', index)
+        self.assertIn('posts:follow_index', report['endpoints'])
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_load_test_needs_posts(self):
+        """Без постов load_test сообщает, чем наполнить базу"""
+        Post.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, 'generate_data'):
+            call_command('load_test', duration=0, stdout=StringIO())
+
+
+class BenchmarkSuiteTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author, group=group, text='Пост про котов'
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader, text='Да')
+
+    def test_suite_runs(self):
+        """Все бенчмарки выполняются, изменения view откатываются"""
+        suite = benchmarks.suite()
+        names = {item.name for item in suite}
+        view_names = {
+            name for name, value in vars(views).items()
+            if callable(value) and getattr(value, '__module__', '') == (
+                views.__name__
+            )
+        }
+        self.assertEqual(
+            {name for name in names if name.startswith('view:')},
+            {f'view:{name}' for name in view_names} | {'view:index:cached'},
+        )
+        results = run(suite, repeat=2, min_time=0)
+        self.assertEqual(set(results), names)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_real_cache_backend(self):
+        """Замеры идут через SQLiteCache в отдельном файле"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with override_settings(CACHES=benchmark_caches(directory)):
+            self.assertIsInstance(caches['default'], SQLiteCache)
+            cache.set('key', 'value')
+            self.assertEqual(cache.get('key'), 'value')
+        self.assertIn('cache.sqlite3', os.listdir(directory))
+        self.assertIsNone(cache.get('key'))
+
+
+class LoadDumpTests(TestCase):
+    USERS = ('anna', 'boris', 'vera')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.records = self.make_records()
+
+    def make_records(self):
+        """Выгрузка в формате dumpdata: пользователи, группа, посты."""
+        records = [
+            {
+                'model': 'auth.user', 'pk': pk,
+                'fields': {'username': username, 'password': '!'},
+            }
+            for pk, username in enumerate(self.USERS, 1)
+        ]
+        records.append({
+            'model': 'posts.group', 'pk': 1,
+            'fields': {'title': 'Кошки', 'slug': 'cats', 'description': ''},
+        })
+        records += [
+            {
+                'model': 'posts.post', 'pk': pk,
+                'fields': {
+                    'text': f'Пост {pk}', 'author': pk % 2 + 1,
+                    'group': 1 if pk % 3 else None,
+                    'pub_date': f'2024-01-{pk:02}T12:00:00Z',
+                    'updated': f'2024-01-{pk:02}T13:00:00Z',
+                },
+            }
+            for pk in range(1, 13)
+        ]
+        records += [
+            {
+                'model': 'posts.comment', 'pk': pk,
+                'fields': {
+                    'post': pk % 4 + 1, 'author': 3, 'text': 'Да',
+                    'created': '2024-02-01T12:00:00Z',
+                },
+            }
+            for pk in range(1, 10)
+        ]
+        records += [
+            {'model': 'posts.follow', 'pk': pk, 'fields': fields}
+            for pk, fields in enumerate((
+                {'user': 3, 'author': 1},
+                {'user': 3, 'author': 2},
+                {'user': 1, 'author': 2},
+            ), 1)
+        ]
+        return records
+
+    def write_json(self, name, records):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(records, file, ensure_ascii=False)
+        return path
+
+    def write_ndjson(self, name, records):
+        path = os.path.join(self.directory, name)
+        with gzip.open(path, 'wt', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(record) + '\n')
+        return path
+
+    def expected(self, label):
+        return sum(record['model'] == label for record in self.records)
+
+    def test_loads_dump(self):
+        """load_dump загружает выгрузку и пересчитывает производные данные"""
+        output = StringIO()
+        call_command(
+            'load_dump', self.write_json('dump.json', self.records),
+            batch_size=5, stdout=output,
+        )
+        self.assertEqual(User.objects.count(), self.expected('auth.user'))
+        self.assertEqual(Post.objects.count(), self.expected('posts.post'))
+        self.assertEqual(
+            Comment.objects.count(), self.expected('posts.comment')
+        )
+        self.assertEqual(Follow.objects.count(), self.expected('posts.follow'))
+        for post in Post.objects.all():
+            self.assertEqual(post.comment_count, post.comments.count())
+        follow = Follow.objects.first()
+        self.assertEqual(
+            follow.author.stats.followers_count,
+            follow.author.following.count(),
+        )
+        self.assertTrue(TimelineEntry.objects.filter(user=3).exists())
+        # Даты auto_now и auto_now_add остаются такими, как в выгрузке.
+        post = Post.objects.get(pk=3)
+        self.assertEqual(
+            (post.pub_date, post.updated),
+            (
+                datetime(2024, 1, 3, 12, tzinfo=timezone.utc),
+                datetime(2024, 1, 3, 13, tzinfo=timezone.utc),
+            ),
+        )
+        self.assertEqual(
+            set(Comment.objects.values_list('created', flat=True)),
+            {datetime(2024, 2, 1, 12, tzinfo=timezone.utc)},
+        )
+        self.assertIn(
+            f'Обработано {len(self.records)} записей', output.getvalue()
+        )
+        self.assertIn('записей в секунду', output.getvalue())
+
+    def test_ignore_conflicts_counts_inserted(self):
+        """С --ignore-conflicts отчёт отделяет добавленные от имевшихся"""
+        User.objects.create_user(username='anna', pk=1)
+        users = [
+            record for record in self.records
+            if record['model'] == 'auth.user'
+        ]
+        output = StringIO()
+        call_command(
+            'load_dump', self.write_json('users.json', users),
+            ignore_conflicts=True, skip_derived=True, stdout=output,
+        )
+        self.assertEqual(User.objects.count(), len(self.USERS))
+        self.assertIn(
+            f'добавлено {len(self.USERS) - 1}, уже были в базе 1',
+            output.getvalue(),
+        )
+
+    def test_exclude(self):
+        """Исключённые модели и приложения не загружаются"""
+        output = StringIO()
+        call_command(
+            'load_dump', self.write_json('dump.json', self.records),
+            exclude=['posts.comment', 'posts.follow'], skip_derived=True,
+            stdout=output,
+        )
+        self.assertEqual(Post.objects.count(), self.expected('posts.post'))
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        excluded = self.expected('posts.comment') + self.expected(
+            'posts.follow'
+        )
+        self.assertIn(f'исключено {excluded}', output.getvalue())
+
+    def test_forward_references_ndjson(self):
+        """Записи могут ссылаться на объекты дальше по файлу"""
+        wanted = ('auth.user', 'posts.group', 'posts.post', 'posts.comment')
+        records = sorted(
+            (record for record in self.records if record['model'] in wanted),
+            key=lambda record: -wanted.index(record['model']),
+        )
+        call_command(
+            'load_dump', self.write_ndjson('dump.ndjson.gz', records),
+            batch_size=4, skip_derived=True, stdout=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), self.expected('posts.post'))
+        self.assertEqual(
+            Comment.objects.count(), self.expected('posts.comment')
+        )
+
+    def test_broken_reference_rolls_back(self):
+        """Ссылка на несуществующий объект отменяет всю загрузку"""
+        records = [
+            record for record in self.records
+            if record['model'] in ('auth.user', 'posts.post')
+        ]
+        records[-1]['fields']['author'] = 10 ** 6
+        with self.assertRaises(CommandError):
+            call_command(
+                'load_dump', self.write_ndjson('broken.ndjson.gz', records),
+                skip_derived=True, stdout=StringIO(),
+            )
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Post.objects.exists())
@@ -1,21 +1,76 @@
+import hashlib
+import os
 import shutil
+import struct
 import tempfile
+import time
+import tracemalloc
+import zlib
 
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.test import Client, RequestFactory, TestCase
 from django.test.utils import override_settings
 from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail.default import storage as sorl_storage
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.models import KVStore
 
-from ..models import Comment, Group, Post
+from .. import blobs, thumbnails, views
+from ..models import Comment, Group, ImageBlob, Post, image_storage
+from .utils import run_commit_hooks
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def content_name(content, extension):
+    """Имя, под которым хранилище сохранит файл с таким содержимым."""
+    digest = hashlib.sha256(content).hexdigest()
+    return f'posts/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def png(color, size=(2, 1)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def png_header(width, height):
+    """PNG, у которого в заголовке указаны размеры, а данных — на строку."""
+    def chunk(kind, data):
+        return (
+            struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data))
+        )
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(b'\x00' * (width + 1))),
+        chunk(b'IEND', b''),
+    ))
+
+
+def traced(function, *args, **kwargs):
+    """Результат вызова и пик памяти, выделенной Python за вызов."""
+    tracemalloc.start()
+    try:
+        result = function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class FormTests(TestCase):
     @classmethod
@@ -124,9 +179,130 @@ class FormTests(TestCase):
                 text=form_data['text'],
                 author=self.user,
                 group=self.group,
-                image='posts/small.gif'
+                image=content_name(small_gif, '.gif')
             ).exists()
         )
+        post = Post.objects.get(image=content_name(small_gif, '.gif'))
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertRegex(post.image_color, r'^#[0-9a-f]{6}$')
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/png;base64,')
+        )
+
+    def test_post_image_thumbnails(self):
+        """Миниатюры новой картинки ставятся в очередь и готовятся"""
+        content = png((0, 128, 0))
+        uploaded = SimpleUploadedFile(
+            name='thumb.png', content=content, content_type='image/png'
+        )
+        with mock.patch.object(thumbnails, 'enqueue') as enqueue:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'С картинкой', 'image': uploaded},
+            )
+        enqueue.assert_called_once_with(content_name(content, '.png'))
+        self.assertTrue(thumbnails.generate(content_name(content, '.png')))
+        self.assertTrue(any(
+            files for _, _, files in os.walk(
+                os.path.join(TEMP_MEDIA_ROOT, 'cache')
+            )
+        ))
+
+    def test_prefetch_thumbnails(self):
+        """Готовые миниатюры страницы достаются одним запросом"""
+        posts = [
+            Post.objects.create(
+                text=f'Пост {number}',
+                author=self.user,
+                image=SimpleUploadedFile(
+                    name=f'page{number}.png',
+                    content=png((number, 0, 0)),
+                    content_type='image/png',
+                ),
+            )
+            for number in range(3)
+        ]
+        posts.append(
+            Post.objects.create(text='Без картинки', author=self.user)
+        )
+        for post in posts[:2]:
+            thumbnails.generate(post.image.name)
+        cache.clear()
+        with self.assertNumQueries(1):
+            thumbnails.prefetch(posts)
+        with self.assertNumQueries(0):
+            thumbnails.prefetch(posts)
+        for post in posts[:2]:
+            geometry, options = thumbnails.CARD_GEOMETRY
+            self.assertEqual(
+                post.thumbnail.url,
+                thumbnails.get_thumbnail(post.image, geometry, **options).url,
+            )
+            self.assertTrue(post.thumbnails_ready)
+            self.assertIn(
+                ('image/webp', ', '.join(
+                    f'{image.url} {width}w'
+                    for image, width in zip(
+                        [
+                            thumbnails.get_thumbnail(
+                                post.image, geometry, **options
+                            )
+                            for format_, _, _, (geometry, options)
+                            in thumbnails.VARIANTS if format_ == 'WEBP'
+                        ],
+                        thumbnails.VARIANT_WIDTHS,
+                    )
+                )),
+                post.thumbnail_sources,
+            )
+        self.assertIsNone(posts[2].thumbnail)
+        self.assertFalse(posts[2].thumbnails_ready)
+        self.assertIsNone(posts[3].thumbnail)
+        self.assertTrue(posts[3].thumbnails_ready)
+
+    def test_thumbnail_variants_without_exif(self):
+        """Варианты картинки сохраняются без EXIF"""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'JPEG', exif=exif)
+        post = Post.objects.create(
+            text='Фото',
+            author=self.user,
+            image=SimpleUploadedFile('photo.jpg', buffer.getvalue()),
+        )
+        self.assertIn('exif', Image.open(post.image.path).info)
+        thumbnails.generate(post.image.name)
+        for geometry, options in thumbnails.GEOMETRIES:
+            thumbnail = thumbnails.get_thumbnail(
+                post.image, geometry, **options
+            )
+            with Image.open(thumbnail.storage.path(thumbnail.name)) as image:
+                self.assertEqual(
+                    image.format, options.get('format', 'JPEG')
+                )
+                self.assertNotIn('exif', image.info)
+
+    def test_backfill_image_metadata(self):
+        """Команда заполняет размеры и заглушку старых картинок"""
+        buffer = BytesIO()
+        Image.new('RGB', (30, 10), '#ff0000').save(buffer, 'PNG')
+        post = Post.objects.create(
+            text='Старый пост',
+            author=self.user,
+            image=SimpleUploadedFile('old.png', buffer.getvalue()),
+        )
+        call_command(
+            'backfill_image_metadata', workers=1, stdout=StringIO()
+        )
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (30, 10))
+        self.assertEqual(post.image_color, '#ff0000')
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, post.image_placeholder)
 
     def test_can_comment_post(self):
         """При отправке валидной формы появляется комментарий"""
@@ -156,3 +332,276 @@ class FormTests(TestCase):
             ).exists()
         )
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    MAX_UPLOAD_SIZE=256 * 1024,
+    MAX_IMAGE_PIXELS=1_000_000,
+    MAX_IMAGE_SIDE=64,
+)
+class UploadLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='uploader')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def send(self, view, image, **kwargs):
+        url = reverse(f'posts:{view.__name__}', kwargs=kwargs)
+        # Шаблоны компилируются при первой отрисовке: не считаем это.
+        warm_up = self.factory.get(url)
+        warm_up.user = self.user
+        view(warm_up, **kwargs)
+        request = self.factory.post(url, {'text': 'Текст', 'image': image})
+        request.user = self.user
+        # Как тестовый клиент: CSRF проверяет декоратор limit_uploads.
+        request._dont_enforce_csrf_checks = True
+        return traced(view, request, **kwargs)
+
+    def test_oversized_upload_is_not_buffered(self):
+        """Загрузка сверх лимита обрывается, не оседая в памяти"""
+        image = SimpleUploadedFile(
+            'huge.png', png_header(10, 10) + os.urandom(4 * 1024 * 1024),
+            content_type='image/png',
+        )
+        post_count = Post.objects.count()
+        response, peak = self.send(views.post_create, image)
+        self.assertContains(response, 'Файл больше 256,0\xa0КБ')
+        self.assertEqual(Post.objects.count(), post_count)
+        self.assertLess(peak, 1024 * 1024)
+
+    def test_csrf_still_checked(self):
+        """Формы постов с ограничением загрузок проверяют CSRF"""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        posts_count = Post.objects.count()
+        for url in (
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+        ):
+            with self.subTest(url=url):
+                response = client.post(url, {'text': 'Без токена'})
+                self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.post.refresh_from_db()
+        self.assertNotEqual(self.post.text, 'Без токена')
+
+    def test_pixel_bomb_is_not_decoded(self):
+        """Картинка с огромными размерами отклоняется по заголовку"""
+        image = SimpleUploadedFile(
+            'bomb.png', png_header(8000, 8000), content_type='image/png'
+        )
+        with mock.patch.object(Image.Image, 'load') as load:
+            response, peak = self.send(
+                views.post_edit, image, post_id=self.post.pk
+            )
+        load.assert_not_called()
+        self.assertContains(response, 'Картинка больше 1 мегапикселей')
+        self.post.refresh_from_db()
+        self.assertFalse(self.post.image)
+        self.assertLess(peak, 1024 * 1024)
+
+    def test_large_image_is_downscaled(self):
+        """Картинки больше MAX_IMAGE_SIDE сохраняются уменьшенными"""
+        for view, kwargs in (
+            (views.post_create, {}),
+            (views.post_edit, {'post_id': self.post.pk}),
+        ):
+            with self.subTest(view=view.__name__):
+                buffer = BytesIO()
+                Image.new('RGB', (400, 200), 'blue').save(buffer, 'JPEG')
+                response, _ = self.send(
+                    view,
+                    SimpleUploadedFile(
+                        f'{view.__name__}.jpg', buffer.getvalue(),
+                        content_type='image/jpeg',
+                    ),
+                    **kwargs,
+                )
+                self.assertEqual(response.status_code, HTTPStatus.FOUND)
+                post = Post.objects.get(
+                    pk=kwargs.get('post_id') or Post.objects.latest('pk').pk
+                )
+                self.assertEqual(
+                    (post.image_width, post.image_height), (64, 32)
+                )
+                with Image.open(post.image.path) as image:
+                    self.assertEqual(image.size, (64, 32))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='collector')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, content, name='same.png'):
+        return Post.objects.create(
+            text='Картинка',
+            author=self.user,
+            image=SimpleUploadedFile(name, content),
+        )
+
+    def test_same_images_share_one_file(self):
+        """Одинаковые картинки хранятся одним файлом со счётчиком ссылок"""
+        content = png((1, 2, 3))
+        first = self.create_post(content, 'first.png')
+        second = self.create_post(content, 'SECOND.PNG')
+        name = content_name(content, '.png')
+        self.assertEqual([first.image.name, second.image.name], [name] * 2)
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(first.image.path))),
+            [os.path.basename(name)],
+        )
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 2)
+        first.delete()
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 1)
+        second.image = SimpleUploadedFile('other.png', png((3, 2, 1)))
+        second.save()
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        self.assertEqual(
+            ImageBlob.objects.get(name=second.image.name).references, 1
+        )
+
+    def test_unused_file_deleted_after_commit(self):
+        """Файл без ссылок удаляется после фиксации, свежий остаётся"""
+        old, fresh = (
+            self.create_post(png(color)) for color in ('red', 'green')
+        )
+        stale = time.time() - blobs.FRESH_SECONDS - 60
+        os.utime(old.image.path, (stale, stale))
+        old.delete()
+        fresh.delete()
+        self.assertTrue(image_storage.exists(old.image.name))
+        run_commit_hooks()
+        self.assertFalse(image_storage.exists(old.image.name))
+        self.assertTrue(image_storage.exists(fresh.image.name))
+
+    def test_reupload_keeps_released_file(self):
+        """Повторная загрузка до фиксации удаления сохраняет файл"""
+        content = png('blue')
+        post = self.create_post(content)
+        stale = time.time() - blobs.FRESH_SECONDS - 60
+        os.utime(post.image.path, (stale, stale))
+        post.delete()
+        # Ссылка второй загрузки ещё не зафиксирована: файл уже на месте,
+        # а записи ImageBlob нет.
+        name = image_storage.save('posts/again.png', ContentFile(content))
+        self.assertEqual(name, post.image.name)
+        run_commit_hooks()
+        self.assertTrue(image_storage.exists(name))
+
+    def test_rehash_images(self):
+        """Команда переносит старые файлы на адреса по содержимому"""
+        content = png((4, 5, 6))
+        posts = []
+        for legacy in ('posts/legacy.png', 'posts/copy.png'):
+            os.makedirs(image_storage.path('posts'), exist_ok=True)
+            with open(image_storage.path(legacy), 'wb') as file:
+                file.write(content)
+            posts.append(Post.objects.create(
+                text='Старый пост', author=self.user, image=legacy
+            ))
+        self.assertFalse(ImageBlob.objects.exists())
+        call_command('rehash_images', batch_size=1, stdout=StringIO())
+        name = content_name(content, '.png')
+        for post in posts:
+            post.refresh_from_db()
+            self.assertEqual(post.image.name, name)
+        self.assertTrue(image_storage.exists(name))
+        self.assertFalse(image_storage.exists('posts/legacy.png'))
+        self.assertFalse(image_storage.exists('posts/copy.png'))
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 2)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaGarbageTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Записи sorl в кэше пережили бы откат базы после прошлого теста.
+        cache.clear()
+        user = User.objects.create_user(username='gardener')
+        self.kept, self.deleted = [
+            Post.objects.create(
+                text='Пост',
+                author=user,
+                image=SimpleUploadedFile(name, png(color)),
+            )
+            for name, color in (('kept.png', 'red'), ('gone.png', 'blue'))
+        ]
+        for post in (self.kept, self.deleted):
+            thumbnails.generate(post.image.name)
+        self.thumbnails = {
+            post.image.name: [
+                thumbnails.get_thumbnail(post.image, geometry, **options).name
+                for geometry, options in thumbnails.GEOMETRIES
+            ]
+            for post in (self.kept, self.deleted)
+        }
+        self.deleted.delete()
+        self.stray = 'cache/00/00/stray.jpg'
+        os.makedirs(
+            os.path.dirname(sorl_storage.path(self.stray)), exist_ok=True
+        )
+        with open(sorl_storage.path(self.stray), 'wb') as file:
+            file.write(b'stray')
+
+    def collect(self, **options):
+        out = StringIO()
+        call_command('collect_media_garbage', stdout=out, **options)
+        return out.getvalue()
+
+    def files_exist(self, post):
+        return [
+            image_storage.exists(post.image.name),
+            *map(sorl_storage.exists, self.thumbnails[post.image.name]),
+        ]
+
+    def test_dry_run_reports_orphans(self):
+        """Пробный запуск считает сирот и ничего не удаляет"""
+        output = self.collect(dry_run=True, min_age=0)
+        self.assertIn('Будет удалено: Картинки без постов: 1', output)
+        self.assertIn(
+            'Будет удалено: Миниатюры удалённых картинок: '
+            f'{len(thumbnails.GEOMETRIES)}',
+            output,
+        )
+        self.assertIn('Будет удалено: Миниатюры вне хранилища sorl: 1', output)
+        self.assertTrue(all(self.files_exist(self.deleted)))
+        self.assertTrue(sorl_storage.exists(self.stray))
+
+    def test_orphans_are_removed(self):
+        """Сироты удаляются вместе с записями sorl, нужные файлы целы"""
+        self.collect(min_age=0)
+        self.assertFalse(any(self.files_exist(self.deleted)))
+        self.assertFalse(sorl_storage.exists(self.stray))
+        self.assertTrue(all(self.files_exist(self.kept)))
+        self.assertFalse(KVStore.objects.filter(
+            key__contains=ImageFile(self.deleted.image).key
+        ).exists())
+        cache.clear()
+        thumbnails.prefetch([self.kept])
+        self.assertTrue(self.kept.thumbnails_ready)
+
+    def test_fresh_files_are_kept(self):
+        """Файлы моложе --min-age не трогаются"""
+        self.collect()
+        self.assertTrue(image_storage.exists(self.deleted.image.name))
+        self.assertTrue(sorl_storage.exists(self.stray))
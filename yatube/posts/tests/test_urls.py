@@ -1,10 +1,18 @@
 from http import HTTPStatus
+from importlib import import_module
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
 
-from ..models import Follow, Group, Post
+from core.queries import (
+    QueryBudgetExceeded, assert_within_budget, budget, record_queries,
+)
+
+from ..models import Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -116,3 +124,82 @@ class StaticURLTests(TestCase):
                         and adress != '/create/' and adress != '/follow/':
                     response = self.guest_client.get(adress)
                     self.assertTemplateUsed(response, template)
+
+
+@override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True)
+class QueryBudgetTests(TestCase):
+    """Каждая страница posts, users и about укладывается в бюджет запросов.
+
+    Бюджеты и поиск N+1 проверяет `core.queries.QueryBudgetMiddleware`,
+    здесь он включён и выбрасывает `QueryBudgetExceeded`. Постов и комментариев
+    больше порога повторов, чтобы запрос на строку был заметен.
+    """
+    URLCONFS = ('posts.urls', 'users.urls', 'about.urls')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        commenters = [
+            User.objects.create_user(username=f'commenter{num}')
+            for num in range(settings.QUERY_REPEAT_THRESHOLD + 1)
+        ]
+        for num in range(settings.OBJECTS_PER_PAGE):
+            post = Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {num}'
+            )
+        for commenter in commenters:
+            Comment.objects.create(post=post, author=commenter, text='Да')
+        cls.post = post
+        cls.kwargs = {
+            'slug': cls.group.slug,
+            'username': cls.author.username,
+            'post_id': cls.post.pk,
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.author)
+
+    def urls(self):
+        for urlconf in self.URLCONFS:
+            module = import_module(urlconf)
+            for pattern in module.urlpatterns:
+                kwargs = {
+                    name: self.kwargs[name]
+                    for name in pattern.pattern.converters
+                }
+                yield f'{module.app_name}:{pattern.name}', kwargs
+
+    def test_pages_within_budget(self):
+        """Ни одна страница не превышает бюджет и не делает N+1"""
+        for name, kwargs in self.urls():
+            url = reverse(name, kwargs=kwargs)
+            # Вторая отдача идёт из кэшей, которые наполнила первая.
+            for attempt in ('first', 'cached'):
+                with self.subTest(url=name, attempt=attempt):
+                    with record_queries() as log:
+                        response = self.client.get(url, {'q': 'пост'})
+                    self.assertIn(
+                        response.status_code,
+                        (HTTPStatus.OK, HTTPStatus.FOUND),
+                    )
+                    self.assertLessEqual(len(log), budget(name))
+            self.client.force_login(self.author)
+
+    def test_n_plus_one_reports_template_line(self):
+        """Повторяющийся запрос попадает в отчёт со строкой шаблона"""
+        template = Template(
+            '{% for comment in comments %}\n'
+            '{{ comment.author.username }}\n'
+            '{% endfor %}'
+        )
+        with record_queries() as log:
+            template.render(Context({'comments': Comment.objects.all()}))
+        with self.assertRaisesRegex(
+            QueryBudgetExceeded, r'N\+1, 4 раз из .*:2: SELECT'
+        ):
+            assert_within_budget(log, 'test')
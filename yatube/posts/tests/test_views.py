@@ -1,11 +1,30 @@
+import re
+from io import StringIO
+from unittest import mock
+from urllib.parse import quote
+
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Follow, Group, Post
+from .. import autocomplete, timeline
+from ..cache import (
+    AUTHOR, FEED, LOCK_KEY, VERSION_KEY, bump, cache_feed, get_versions,
+    page_key,
+)
+from ..cards import render_cards
+from ..models import (
+    AuthorStats, Comment, Follow, Group, Post, TimelineEntry,
+)
+from ..paginator import NEXT, pack_cursor
+from .utils import run_commit_hooks
 
 User = get_user_model()
 
@@ -230,6 +249,90 @@ class PaginatorViewsTest(TestCase):
                 )
 
 
+@override_settings(POSTS_CURSOR_PAGINATION=True)
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.POST_COUNT = settings.OBJECTS_PER_PAGE + 3
+        Post.objects.bulk_create(
+            Post(text=f'Пост №{num}', author=cls.user, group=cls.group)
+            for num in range(cls.POST_COUNT)
+        )
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user}),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages(self):
+        """Курсор ведёт на следующую и обратно на предыдущую страницу"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url).context['page_obj']
+                self.assertEqual(len(first), settings.OBJECTS_PER_PAGE)
+                self.assertFalse(first.has_previous())
+                second = self.client.get(
+                    url, {'cursor': first.next_cursor()}
+                ).context['page_obj']
+                self.assertEqual(
+                    len(second),
+                    self.POST_COUNT - settings.OBJECTS_PER_PAGE
+                )
+                self.assertFalse(second.has_next())
+                back = self.client.get(
+                    url, {'cursor': second.previous_cursor()}
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+
+    def test_new_posts_do_not_shift_pages(self):
+        """Новые посты не сдвигают следующую страницу"""
+        url = reverse('posts:index')
+        first = self.client.get(url).context['page_obj']
+        Post.objects.create(text='Свежий пост', author=self.user)
+        cache.clear()
+        second = self.client.get(
+            url, {'cursor': first.next_cursor()}
+        ).context['page_obj']
+        self.assertEqual(
+            len(second), self.POST_COUNT - settings.OBJECTS_PER_PAGE
+        )
+        self.assertFalse(set(first) & set(second))
+
+    def test_invalid_cursor_shows_first_page(self):
+        """Битый курсор открывает первую страницу"""
+        response = self.client.get(reverse('posts:index'), {'cursor': 'xx'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), settings.OBJECTS_PER_PAGE)
+        self.assertFalse(page_obj.has_previous())
+
+    def test_tampered_cursor_shows_first_page(self):
+        """Курсор с невозможной датой или чужим ключом не ломает ленту"""
+        date = '2020-01-01T00:00:00+00:00'
+        for position in (
+            ['2020-13-45T00:00:00', 1], [date, True], [date, '1'],
+            [date, 1.5], [None, 1],
+        ):
+            cursor = pack_cursor(NEXT, position)
+            for url in self.urls:
+                with self.subTest(position=position, url=url):
+                    cache.clear()
+                    response = self.client.get(url, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertFalse(
+                        response.context['page_obj'].has_previous()
+                    )
+
+
 class CacheTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -245,11 +348,694 @@ class CacheTests(TestCase):
         self.authorized_client_author.force_login(self.post_author)
 
     def test_cache(self):
-        """Проверка кэша"""
+        """Страница берётся из кэша, пока данные не менялись"""
         response = self.client.get(reverse('posts:index'))
-        self.post.delete()
-        post_delete = self.client.get(reverse('posts:index'))
-        self.assertEqual(response.content, post_delete.content)
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        cached = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.content, cached.content)
         cache.clear()
         response = self.client.get(reverse('posts:index'))
-        self.assertNotEqual(response.content, post_delete.content)
+        self.assertNotEqual(response.content, cached.content)
+
+    def test_cache_invalidated_on_change(self):
+        """Изменение поста сбрасывает кэш его страниц"""
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': self.post_author}),
+        ]
+        for url in pages:
+            with self.subTest(url=url):
+                cached = self.client.get(url)
+                post = Post.objects.create(
+                    author=self.post_author, text=f'Новый пост {url}'
+                )
+                response = self.client.get(url)
+                self.assertNotEqual(response.content, cached.content)
+                self.assertIn(post, response.context['page_obj'])
+
+    def test_versions_bumped_again_after_commit(self):
+        """Версии областей повышаются ещё раз после фиксации транзакции"""
+        scopes = [FEED, AUTHOR.format(self.post_author.username)]
+        before = get_versions(scopes)
+        Post.objects.create(author=self.post_author, text='Новый пост')
+        changed = get_versions(scopes)
+        run_commit_hooks()
+        committed = get_versions(scopes)
+        for old, new, last in zip(before, changed, committed):
+            self.assertLess(old, new)
+            self.assertLess(new, last)
+
+    def test_stale_page_served_while_recomputing(self):
+        """Пока страницу пересчитывают, остальные получают старую копию"""
+        url = reverse('posts:index')
+        cached = self.client.get(url)
+        Post.objects.create(author=self.post_author, text='Новый пост')
+        key = page_key(cached.wsgi_request, 'index')
+        cache.add(LOCK_KEY.format(key), 1)
+        self.assertEqual(self.client.get(url).content, cached.content)
+        cache.delete(LOCK_KEY.format(key))
+        self.assertNotEqual(self.client.get(url).content, cached.content)
+
+    def test_shared_page_personalized(self):
+        """Одна копия страницы отдаётся всем со своими фрагментами"""
+        follower = User.objects.create_user(username='Follower')
+        Follow.objects.create(user=follower, author=self.post_author)
+        follower_client = Client()
+        follower_client.force_login(follower)
+        url = reverse('posts:profile', kwargs={'username': self.post_author})
+        author_page = self.authorized_client_author.get(url)
+        with self.assertNumQueries(3):
+            follower_page = follower_client.get(url)
+        self.assertContains(author_page, '<b> Author </b>', html=False)
+        self.assertNotContains(author_page, 'Подписаться')
+        self.assertContains(follower_page, '<b> Follower </b>', html=False)
+        self.assertContains(follower_page, 'Отписаться')
+        self.assertNotContains(follower_page, '<!--personal:')
+
+    def test_view_cookies_kept(self):
+        """Куки, выставленные view, доходят до ответа и не кэшируются"""
+        @cache_feed(FEED)
+        def view(request):
+            response = HttpResponse('Лента')
+            response.set_cookie('seen', request.GET['name'])
+            return response
+
+        factory = RequestFactory()
+        for name in ('first', 'second'):
+            with self.subTest(name=name):
+                response = view(factory.get('/', {'name': name}))
+                self.assertEqual(response.cookies['seen'].value, name)
+
+    def test_page_key_normalized(self):
+        """Равнозначные параметры страницы дают один ключ кэша"""
+        url = reverse('posts:index')
+        key = page_key(self.client.get(url, {'page': 2}).wsgi_request, 'i')
+        for query in ('page=02', 'page=x&page=2', 'page=2&utm=1'):
+            with self.subTest(query=query):
+                request = self.client.get(f'{url}?{query}').wsgi_request
+                self.assertEqual(page_key(request, 'i'), key)
+        first = page_key(self.client.get(url).wsgi_request, 'i')
+        for query in ('page=1', 'page=abc', 'cursor=broken'):
+            with self.subTest(query=query):
+                request = self.client.get(f'{url}?{query}').wsgi_request
+                self.assertEqual(page_key(request, 'i'), first)
+
+    def test_cursor_ignored_without_cursor_mode(self):
+        """Курсор, в том числе битый, без режима курсора не влияет на ключ"""
+        url = reverse('posts:index')
+        first = page_key(self.client.get(url).wsgi_request, 'i')
+        for position in (['2020-13-45T00:00:00', 1], ['2020-01-01', 1]):
+            cursor = pack_cursor(NEXT, position)
+            with self.subTest(position=position):
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(page_key(response.wsgi_request, 'i'), first)
+
+    @override_settings(FEED_CACHE_SOFT_TIMEOUT=-1)
+    def test_page_recomputed_after_soft_timeout(self):
+        """После мягкого срока страница пересчитывается"""
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        self.assertContains(self.client.get(url), 'Без сигналов')
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post_author = User.objects.create_user(username='Author')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def get_feed(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков"""
+        Follow.objects.create(user=self.user, author=self.post_author)
+        post = Post.objects.create(author=self.post_author, text='Пост')
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        self.assertEqual(self.get_feed(), [post])
+
+    def test_unfollow_trims_timeline(self):
+        """После отписки посты автора пропадают из ленты"""
+        Post.objects.create(author=self.post_author, text='Пост')
+        Follow.objects.create(user=self.user, author=self.post_author)
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.post_author}
+        ))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user))
+        self.assertEqual(self.get_feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_posts_merged_on_read(self):
+        """Посты популярных авторов подмешиваются при чтении"""
+        # Подписка сама сбрасывает кэш знаменитостей: автор в них перешёл.
+        Follow.objects.create(user=self.user, author=self.post_author)
+        post = Post.objects.create(author=self.post_author, text='Пост')
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user))
+        self.assertEqual(self.get_feed(), [post])
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_fan_out_trims_timeline(self):
+        """После раскладки в ленте остаются последние записи"""
+        Follow.objects.create(user=self.user, author=self.post_author)
+        with mock.patch.object(timeline, 'TRIM_EVERY', 1):
+            posts = [
+                Post.objects.create(
+                    author=self.post_author, text=f'Пост {num}'
+                )
+                for num in range(3)
+            ]
+        self.assertEqual(set(TimelineEntry.objects.values_list(
+            'post', flat=True
+        )), {posts[1].pk, posts[2].pk})
+
+    @override_settings(TIMELINE_LENGTH=1)
+    def test_fan_out_trims_some_timelines(self):
+        """Раскладка подрезает ленты выборочно, длина остаётся ограниченной"""
+        readers = [self.user, User.objects.create_user(username='other')]
+        for reader in readers:
+            Follow.objects.create(user=reader, author=self.post_author)
+        with mock.patch.object(timeline, 'TRIM_EVERY', 2):
+            for num in range(6):
+                post = Post.objects.create(
+                    author=self.post_author, text=f'{num}'
+                )
+                for reader in readers:
+                    length = TimelineEntry.objects.filter(user=reader).count()
+                    self.assertLessEqual(length, 1 + 2)
+                    if (post.pk + reader.pk) % 2 == 0:
+                        self.assertEqual(length, 1)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_demoted_author_posts_fanned_out(self):
+        """Посты автора, переставшего быть популярным, попадают в ленты"""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.user, author=self.post_author)
+        Follow.objects.create(user=other, author=self.post_author)
+        post = Post.objects.create(author=self.post_author, text='Пост')
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user))
+        Follow.objects.get(user=other).delete()
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        self.assertEqual(self.get_feed(), [post])
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты"""
+        Follow.objects.create(user=self.user, author=self.post_author)
+        post = Post.objects.create(author=self.post_author, text='Пост')
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.get_feed(), [post])
+
+
+class AuthorStatsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post_author = User.objects.create_user(username='Author')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def get_stats(self, user):
+        return AuthorStats.objects.get(author=user)
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются при создании и удалении постов и подписок"""
+        post = Post.objects.create(author=self.post_author, text='Пост')
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.post_author}
+        ))
+        author_stats = self.get_stats(self.post_author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(self.get_stats(self.user).following_count, 1)
+        post.delete()
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.post_author}
+        ))
+        author_stats = self.get_stats(self.post_author)
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(self.get_stats(self.user).following_count, 0)
+
+    def test_drifted_counters_recomputed(self):
+        """Счётчик, ушедший бы ниже нуля, пересчитывается по данным"""
+        post = Post.objects.create(author=self.post_author, text='Пост')
+        Post.objects.create(author=self.post_author, text='Второй')
+        Follow.objects.create(user=self.user, author=self.post_author)
+        AuthorStats.objects.update(
+            posts_count=0, followers_count=0, following_count=0
+        )
+        post.delete()
+        Follow.objects.all().delete()
+        author_stats = self.get_stats(self.post_author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(self.get_stats(self.user).following_count, 0)
+
+    def test_profile_shows_stats(self):
+        """Профиль выводит число постов из счётчика"""
+        Post.objects.create(author=self.post_author, text='Пост')
+        cache.clear()
+        response = self.client.get(reverse(
+            'posts:profile', kwargs={'username': self.post_author}
+        ))
+        self.assertEqual(response.context['author_stats'].posts_count, 1)
+
+    def test_reconcile_author_stats_command(self):
+        """Команда reconcile_author_stats исправляет расхождения"""
+        Post.objects.create(author=self.post_author, text='Пост')
+        AuthorStats.objects.filter(author=self.post_author).update(
+            posts_count=42, followers_count=7
+        )
+        call_command('reconcile_author_stats', stdout=StringIO())
+        author_stats = self.get_stats(self.post_author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertTrue(AuthorStats.objects.filter(author=self.user).exists())
+
+
+class CommentCounterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_comment_updates_counters(self):
+        """Комментарии обновляют счётчик и дату активности поста"""
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': 'Первый'},
+        )
+        first = Comment.objects.get()
+        second = Comment.objects.create(
+            post=self.post, author=self.user, text='Второй'
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+        self.assertEqual(self.post.last_commented_at, second.created)
+        Comment.objects.filter(pk=second.pk).delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.post.last_commented_at, first.created)
+
+    def test_drifted_counter_recomputed(self):
+        """Удаление комментария при обнулённом счётчике пересчитывает его"""
+        comments = [
+            Comment.objects.create(post=self.post, author=self.user, text=text)
+            for text in ('Первый', 'Второй')
+        ]
+        Post.objects.update(comment_count=0)
+        comments[1].delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.post.last_commented_at, comments[0].created)
+
+    def test_backfill_comment_stats_command(self):
+        """Команда backfill_comment_stats заполняет счётчики"""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Текст'
+        )
+        Post.objects.update(comment_count=0, last_commented_at=None)
+        call_command('backfill_comment_stats', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.post.last_commented_at, comment.created)
+
+
+class PostCardTests(TestCase):
+    TEMPLATE = 'includes/post_info.html'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Группа', slug='test-slug')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_card(self):
+        post = Post.objects.select_related('author', 'group').get()
+        [(_, card)] = render_cards([post], self.TEMPLATE)
+        return card
+
+    def test_card_rendered_once(self):
+        """Карточка берётся из кэша, пока пост не менялся"""
+        self.get_card()
+        Post.objects.update(text='Без правки')
+        self.assertIn('Тестовый пост', self.get_card())
+
+    def test_card_invalidated_on_edit(self):
+        """Правка поста и смена автора обновляют карточку"""
+        self.get_card()
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        self.assertIn('Исправленный пост', self.get_card())
+        self.user.first_name = 'Иван'
+        self.user.save()
+        self.assertIn('Иван', self.get_card())
+
+    def test_page_cards_fetched_together(self):
+        """Карточки страницы достаются из кэша одним запросом"""
+        Post.objects.create(author=self.user, text='Второй пост')
+        with mock.patch.object(
+            cache, 'get_many', wraps=cache.get_many
+        ) as get_many:
+            render_cards(
+                Post.objects.select_related('author', 'group'), self.TEMPLATE
+            )
+        get_many.assert_called_once()
+
+
+@override_settings(OBJECTS_PER_PAGE=2)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(title='Кошки', slug='cats')
+        cls.cats = Post.objects.create(
+            author=cls.user, group=cls.group, text='Ёжик и кошка на крыше'
+        )
+        cls.more_cats = Post.objects.create(
+            author=cls.other, text='Кошки, кошки и ещё раз котики'
+        )
+        cls.dogs = Post.objects.create(author=cls.user, text='Собаки гуляют')
+
+    def find(self, **params):
+        response = self.client.get(reverse('posts:search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_word_forms_and_yo(self):
+        """Находятся другие формы слова и «е» вместо «ё»"""
+        self.assertEqual(
+            set(self.find(q='кошками')), {self.cats, self.more_cats}
+        )
+        self.assertEqual(list(self.find(q='ежики')), [self.cats])
+        self.assertEqual(list(self.find(q='КОШКА крыши')), [self.cats])
+        self.assertEqual(list(self.find(q='кошка OR собака')), [])
+        self.assertIsNone(self.find(q=' "* '))
+
+    def test_ranked_with_filters(self):
+        """Релевантные посты выше; фильтры по группе и автору"""
+        self.assertEqual(self.find(q='кошка')[0], self.more_cats)
+        self.assertEqual(
+            list(self.find(q='кошка', group='cats')), [self.cats]
+        )
+        self.assertEqual(
+            list(self.find(q='кошка', author='other')), [self.more_cats]
+        )
+
+    def test_cursor_pages(self):
+        """Курсор ведёт по страницам выдачи и сохраняет запрос"""
+        posts = [
+            Post.objects.create(author=self.user, text=f'Хомяк номер {num}')
+            for num in range(3)
+        ]
+        first = self.find(q='хомяк')
+        self.assertEqual(len(first), 2)
+        response = self.client.get(reverse('posts:search'), {'q': 'хомяк'})
+        self.assertContains(
+            response, f'?q={quote("хомяк")}&amp;cursor={first.next_cursor()}'
+        )
+        second = self.find(q='хомяк', cursor=first.next_cursor())
+        self.assertEqual(set(first) | set(second), set(posts))
+        self.assertFalse(second.has_next())
+        back = self.find(q='хомяк', cursor=second.previous_cursor())
+        self.assertEqual(list(back), list(first))
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста"""
+        self.dogs.text = 'Собаки спят'
+        self.dogs.save()
+        self.assertEqual(list(self.find(q='спят')), [self.dogs])
+        self.assertEqual(list(self.find(q='гуляют')), [])
+        self.dogs.delete()
+        self.assertEqual(list(self.find(q='спят')), [])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по полнотекстовому индексу"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'кошками'}
+        )
+        self.assertEqual(
+            set(response.context['cl'].result_list),
+            {self.cats, self.more_cats},
+        )
+
+    def test_rebuild_search_index_command(self):
+        """Команда rebuild_search_index восстанавливает индекс"""
+        Post.objects.bulk_create([Post(author=self.user, text='Хомяк')])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM posts_post_fts WHERE rowid = %s', [self.cats.pk]
+            )
+            cursor.execute(
+                "INSERT INTO posts_post_fts (rowid, text) "
+                "VALUES (100500, 'хомяк')"
+            )
+        call_command('rebuild_search_index', batch_size=2, stdout=StringIO())
+        self.assertEqual(len(self.find(q='хомяк')), 1)
+        self.assertIn(self.cats, self.find(q='крыша'))
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='ivanov', first_name='Пётр', last_name='Иванов'
+        )
+        cls.group = Group.objects.create(title='Любители ивы', slug='willow')
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.index.clear()
+        self.addCleanup(autocomplete.index.clear)
+
+    def complete(self, prefix, **params):
+        response = self.client.get(
+            reverse('posts:autocomplete'), {'q': prefix, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [item['label'] for item in response.json()['results']]
+
+    def test_prefixes(self):
+        """Подсказки по началу логина, имени, фамилии, названия и слага"""
+        user_label = 'Пётр Иванов (@ivanov)'
+        self.assertEqual(self.complete('iv'), [user_label])
+        self.assertEqual(self.complete('Петр Ив'), [user_label])
+        self.assertEqual(self.complete('ива'), [user_label])
+        self.assertEqual(self.complete('ив'), [user_label, 'Любители ивы'])
+        self.assertEqual(self.complete('wil'), ['Любители ивы'])
+        self.assertEqual(self.complete('ив', limit=1), [user_label])
+        self.assertEqual(self.complete(' '), [])
+        response = self.client.get(
+            reverse('posts:autocomplete'), {'q': 'will'}
+        )
+        self.assertEqual(response.json()['results'][0]['url'], reverse(
+            'posts:group_list', kwargs={'slug': 'willow'}
+        ))
+
+    def test_answers_from_memory(self):
+        """После загрузки подсказки не обращаются к базе"""
+        autocomplete.complete('iv')
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                autocomplete.complete('ив')
+
+    def test_incremental_updates(self):
+        """Изменения пользователей и групп правят загруженный индекс"""
+        autocomplete.complete('iv')
+        User.objects.create_user(username='ivan')
+        self.user.username = 'petrov'
+        self.user.save()
+        self.group.delete()
+        run_commit_hooks()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                autocomplete.complete('iv'), [autocomplete.complete('ivan')[0]]
+            )
+            self.assertEqual(len(autocomplete.complete('petrov')), 1)
+            self.assertEqual(autocomplete.complete('willow'), [])
+
+    def test_rolled_back_changes_ignored(self):
+        """Откаченные изменения не попадают в индекс"""
+        autocomplete.complete('iv')
+        with transaction.atomic():
+            User.objects.create_user(username='ghost')
+            transaction.set_rollback(True)
+        run_commit_hooks()
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete.complete('ghost'), [])
+
+    def test_evicted_version_set_once(self):
+        """Вытесненная версия ставится заново одним значением"""
+        run_commit_hooks()
+        autocomplete.complete('iv')
+        key = VERSION_KEY.format(autocomplete.SCOPE)
+        cache.delete(key)
+        with mock.patch.object(
+            autocomplete.time, 'time_ns', return_value=5000
+        ):
+            Group.objects.create(title='Ивняк', slug='osier')
+            run_commit_hooks()
+        self.assertEqual(cache.get(key), 5)
+        self.assertEqual(len(autocomplete.complete('ивн')), 1)
+
+    def test_changes_from_other_processes(self):
+        """Версия, повышенная другим процессом, перезагружает индекс"""
+        autocomplete.complete('iv')
+        Group.objects.filter(pk=self.group.pk).update(title='Клёны')
+        bump(autocomplete.SCOPE)
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete.complete('клен'), [])
+        with override_settings(AUTOCOMPLETE_CHECK_INTERVAL=0):
+            self.assertEqual(
+                autocomplete.complete('клен')[0]['label'], 'Клёны'
+            )
+
+
+class QueryPlanTests(TestCase):
+    """Запросы лент не читают таблицы целиком и не сортируют в памяти.
+
+    Каждый SELECT, выполненный страницей, прогоняется через
+    `EXPLAIN QUERY PLAN`: таблицы читаются поиском (`SEARCH`). `SCAN`
+    допустим, только если это обход индекса в порядке `ORDER BY`, который
+    обрывает `LIMIT`, без сортировки во временном дереве. Подмешивание
+    постов знаменитостей в ленту подписок объединяет два источника и
+    сортирует их по определению, но каждый источник тоже читается поиском.
+    """
+    ORDERED_WALK = re.compile(r'^SCAN \S+ USING (COVERING )?INDEX ')
+    SORT = 'TEMP B-TREE'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+        Comment.objects.create(post=cls.post, author=cls.user, text='Да')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def bad_steps(self, url, sort=False, **params):
+        # Страница из кэша лент не выполнила бы запросов.
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.response = self.client.get(url, params)
+        self.assertEqual(self.response.status_code, 200)
+        bad = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                steps = [detail for *_, detail in cursor.fetchall()]
+                bad.extend(
+                    (detail, sql) for detail in steps
+                    if self.is_bad(detail, sql, steps, sort)
+                )
+        return bad
+
+    def is_bad(self, detail, sql, steps, sort):
+        if detail.startswith('SCAN '):
+            return not (
+                self.ORDERED_WALK.match(detail)
+                and ' LIMIT ' in sql
+                and not any(self.SORT in step for step in steps)
+            )
+        return self.SORT in detail and not sort
+
+    def assertIndexedPlans(self, url, sort=False, **params):
+        bad = self.bad_steps(url, sort=sort, **params)
+        self.assertFalse(bad, '\n'.join(f'{d}: {s}' for d, s in bad))
+
+    def test_feeds(self):
+        """Ленты: группа, профиль, подписки и пост"""
+        urls = [
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIndexedPlans(url)
+
+    def test_index_counts_all_posts(self):
+        """Главная с номерами страниц читает целиком только для COUNT"""
+        # Номерам страниц нужно число всех постов; курсорный режим
+        # (test_cursor_feeds) обходится без него.
+        bad = self.bad_steps(reverse('posts:index'))
+        self.assertEqual(
+            [sql for _, sql in bad],
+            ['SELECT COUNT(*) AS "__count" FROM "posts_post"'],
+        )
+
+    @override_settings(
+        TIMELINE_FANOUT_LIMIT=0, POSTS_CURSOR_PAGINATION=True,
+        OBJECTS_PER_PAGE=1,
+    )
+    def test_celebrity_feed(self):
+        """Лента подписок с постами знаменитостей, обе страницы"""
+        second = Post.objects.create(author=self.author, text='2')
+        url = reverse('posts:follow_index')
+        self.assertIndexedPlans(url, sort=True)
+        self.assertEqual(list(self.response.context['page_obj']), [second])
+        cursor = self.response.context['page_obj'].next_cursor()
+        self.assertIndexedPlans(url, sort=True, cursor=cursor)
+        self.assertEqual(
+            list(self.response.context['page_obj']), [self.post]
+        )
+
+    @override_settings(POSTS_CURSOR_PAGINATION=True, OBJECTS_PER_PAGE=1)
+    def test_cursor_feeds(self):
+        """Ленты с курсором, в том числе вторые страницы"""
+        Post.objects.create(author=self.author, group=self.group, text='2')
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIndexedPlans(url)
+                cursor = self.response.context['page_obj'].next_cursor()
+                self.assertIndexedPlans(url, cursor=cursor)
+                self.assertEqual(len(self.response.context['page_obj']), 1)
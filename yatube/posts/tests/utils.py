@@ -0,0 +1,13 @@
+from django.db import connection
+
+
+def run_commit_hooks():
+    """Выполняет колбэки `on_commit`, как при фиксации транзакции.
+
+    `TestCase` держит каждый тест в транзакции, которая откатывается,
+    поэтому иначе такие колбэки не выполняются вовсе.
+    """
+    while connection.run_on_commit:
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for _, callback in callbacks:
+            callback()
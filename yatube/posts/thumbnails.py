@@ -0,0 +1,178 @@
+"""Миниатюры картинок постов, подготовленные заранее.
+
+Карточка поста выводит картинку элементом `<picture>`: варианты WebP
+(и AVIF, если его умеет Pillow) нескольких ширин для `srcset` и JPEG
+`CARD_GEOMETRY` как запасной. Если миниатюры нет, её делает PIL прямо в
+запросе первого посетителя, поэтому при сохранении картинки все
+геометрии из `GEOMETRIES` ставятся в очередь локального пула потоков и
+готовятся в фоне.
+
+Готовые миниатюры карточек целой страницы достаются из хранилища sorl
+одним запросом (`prefetch`), а не отдельным поиском на каждый тег.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedKVStore
+from sorl.thumbnail.models import KVStore
+
+from .models import image_storage
+
+logger = logging.getLogger(__name__)
+
+CARD_WIDTH, CARD_HEIGHT = 960, 339
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+# Должна совпадать с тегом {% thumbnail %} в posts/includes/post_image.html.
+CARD_GEOMETRY = (f'{CARD_WIDTH}x{CARD_HEIGHT}', CARD_OPTIONS)
+VARIANT_WIDTHS = (480, 960)
+VARIANT_FORMATS = (
+    ('AVIF', 'image/avif', {'quality': 60}),
+    ('WEBP', 'image/webp', {'quality': 80}),
+)
+
+
+def variant_geometries():
+    """Варианты для `srcset`: (формат, тип, ширина, (геометрия, опции))."""
+    Image.init()
+    return [
+        (
+            format_, mime_type, width,
+            (
+                f'{width}x{round(width * CARD_HEIGHT / CARD_WIDTH)}',
+                {**CARD_OPTIONS, **options, 'format': format_},
+            ),
+        )
+        for format_, mime_type, options in VARIANT_FORMATS
+        if format_ in Image.SAVE
+        for width in VARIANT_WIDTHS
+    ]
+
+
+VARIANTS = variant_geometries()
+GEOMETRIES = (CARD_GEOMETRY,) + tuple(
+    geometry for *_, geometry in VARIANTS
+)
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def generate(image_name):
+    """Готовит все миниатюры картинки; возвращает успех."""
+    try:
+        source = ImageFile(image_name, image_storage)
+        for geometry, options in GEOMETRIES:
+            get_thumbnail(source, geometry, **options)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры %s', image_name)
+        return False
+    finally:
+        # Поток пула живёт долго: не держим в нём соединение с базой.
+        close_old_connections()
+    return True
+
+
+def enqueue(image_name):
+    """Ставит картинку в очередь после фиксации транзакции."""
+    if settings.THUMBNAIL_PREGENERATE and image_name:
+        transaction.on_commit(
+            lambda: executor().submit(generate, image_name)
+        )
+
+
+def thumbnail_options(source, options):
+    """Параметры миниатюры, дополненные так же, как в `get_thumbnail`."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_key(image, geometry, options):
+    """Ключ миниатюры в хранилище sorl (без обращения к нему)."""
+    source = ImageFile(image)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, thumbnail_options(source, options)
+    )
+    return add_prefix(ImageFile(name, default.storage).key)
+
+
+def lookup(keys):
+    """Сериализованные записи хранилища sorl по списку ключей."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedKVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStore.objects.filter(
+            key__in=missing
+        ).values_list('key', 'value'))
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return values
+
+
+def prefetch(posts):
+    """Достаёт готовые миниатюры картинок постов одним запросом.
+
+    Запасная миниатюра кладётся в `post.thumbnail` (`None`, если её ещё
+    нет, — тогда шаблон делает её тегом `{% thumbnail %}`), готовые
+    варианты — в `post.thumbnail_sources` как пары (тип, srcset), а
+    `post.thumbnails_ready` говорит, что готово всё.
+    """
+    keys = {}
+    for post in posts:
+        if post.image:
+            keys[post.pk] = [
+                thumbnail_key(post.image, geometry, options)
+                for geometry, options in GEOMETRIES
+            ]
+    values = lookup(list({
+        key for post_keys in keys.values() for key in post_keys
+    })) if keys else {}
+    for post in posts:
+        found = [
+            deserialize_image_file(value) if (
+                value and value != EMPTY_VALUE
+            ) else None
+            for value in map(values.get, keys.get(post.pk, ()))
+        ]
+        post.thumbnail = found[0] if found else None
+        post.thumbnails_ready = all(found)
+        sources = {}
+        for (_, mime_type, width, _), image in zip(VARIANTS, found[1:]):
+            if image is not None:
+                sources.setdefault(mime_type, []).append(
+                    f'{image.url} {width}w'
+                )
+        post.thumbnail_sources = [
+            (mime_type, ', '.join(srcset))
+            for mime_type, srcset in sources.items()
+        ]
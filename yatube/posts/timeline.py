@@ -0,0 +1,236 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост раскладывается в ленты подписчиков автора, поэтому чтение
+`follow_index` — один диапазон по индексу (user, pub_date). Посты авторов,
+у которых подписчиков больше `TIMELINE_FANOUT_LIMIT`, не раскладываются,
+а подмешиваются при чтении; когда автор перестаёт быть таким, его
+последние посты раскладываются по лентам подписчиков (`demote`).
+
+Раскладка поста подрезает не все ленты подписчиков, а в среднем каждую
+`TRIM_EVERY`-ю: подрезка читает ленту целиком, а одна новая запись
+удлиняет её на одну. Ленты бывают длиннее `TIMELINE_LENGTH` примерно
+на `TRIM_EVERY` записей.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .paginator import CursorPaginator
+
+CELEBRITIES_CACHE_KEY = 'timeline:celebrities'
+CELEBRITIES_CACHE_TIMEOUT = 60 * 5
+BATCH_SIZE = 500
+TRIM_EVERY = 100
+
+
+def celebrity_authors():
+    """Id авторов, чьи посты подмешиваются в ленты при чтении."""
+    authors = cache.get(CELEBRITIES_CACHE_KEY)
+    if authors is None:
+        authors = set(AuthorStats.objects.filter(
+            followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+        ).values_list('author', flat=True))
+        cache.set(CELEBRITIES_CACHE_KEY, authors, CELEBRITIES_CACHE_TIMEOUT)
+    return authors
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсор по записям ленты: страница — диапазон индекса ленты.
+
+    Дата записи совпадает с датой поста, так что позиция та же, что у
+    `CursorPaginator`. Условие на позицию ставится на уже присоединённую
+    таблицу ленты: новый `filter` по `timeline_entries` добавил бы
+    второе соединение.
+    """
+
+    ordering = ('-timeline_entries__pub_date', '-timeline_entries__post__id')
+
+    def compare(self, posts, position, operator):
+        pub_date, pk = position
+        table = TimelineEntry._meta.db_table
+        return posts.extra(
+            where=[f'({table}.pub_date, {table}.post_id) {operator} (%s, %s)'],
+            params=[connection.ops.adapt_datetimefield_value(pub_date), pk],
+        )
+
+    def after(self, posts, position):
+        return self.compare(posts, position, '<')
+
+    def before(self, posts, position):
+        return self.compare(posts, position, '>')
+
+
+def timeline_posts(user):
+    """Посты ленты подписок от новых к старым и пагинатор по курсору."""
+    posts = Post.objects.select_related('author', 'group')
+    celebrities = list(Follow.objects.filter(
+        user=user, author__in=celebrity_authors()
+    ).values_list('author', flat=True))
+    if not celebrities:
+        return posts.filter(timeline_entries__user=user).order_by(
+            *TimelinePaginator.ordering
+        ), TimelinePaginator
+    entries = TimelineEntry.objects.filter(user=user).values('post')
+    return posts.filter(
+        Q(pk__in=entries) | Q(author__in=celebrities)
+    ).order_by('-pub_date', '-pk'), CursorPaginator
+
+
+def followers(author_id):
+    return list(Follow.objects.filter(
+        author=author_id
+    ).values_list('user', flat=True))
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты подписчиков автора."""
+    if post.author_id in celebrity_authors():
+        return
+    users = followers(post.author_id)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user, post=post, pub_date=post.pub_date)
+            for user in users
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    # Номера постов идут подряд у всех авторов вместе, поэтому каждая
+    # лента попадает сюда примерно раз в TRIM_EVERY новых записей.
+    trim_many([
+        user for user in users if (post.pk + user) % TRIM_EVERY == 0
+    ])
+
+
+def promote(author_id):
+    """Сбрасывает кэш знаменитостей, когда автор в них переходит."""
+    if author_id not in celebrity_authors() and AuthorStats.objects.filter(
+        author=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists():
+        forget_celebrities()
+
+
+def demote(author_id):
+    """Раскладывает посты автора, который больше не знаменитость.
+
+    Пока подписчиков было больше `TIMELINE_FANOUT_LIMIT`, посты автора
+    не попадали в ленты, а подмешивались при чтении. Разовая раскладка
+    его последних постов не даёт им пропасть из лент до пересборки.
+    """
+    if author_id not in celebrity_authors() or not AuthorStats.objects.filter(
+        author=author_id,
+        followers_count__lte=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists():
+        return
+    forget_celebrities()
+    posts = list(Post.objects.filter(author=author_id).order_by(
+        '-pub_date'
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_LENGTH])
+    users = followers(author_id)
+    for user in users:
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user_id=user, post_id=pk, pub_date=pub_date)
+                for pk, pub_date in posts
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    trim_many(users)
+
+
+def forget_celebrities():
+    """Сбрасывает кэш знаменитостей сейчас и после фиксации транзакции."""
+    cache.delete(CELEBRITIES_CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(CELEBRITIES_CACHE_KEY))
+
+
+def backfill(user, author):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if author.pk in celebrity_authors():
+        return
+    posts = author.posts.order_by('-pub_date').values_list('pk', 'pub_date')
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user=user, post_id=pk, pub_date=pub_date)
+                for pk, pub_date in posts[:settings.TIMELINE_LENGTH]
+            ),
+            ignore_conflicts=True,
+        )
+        trim(user)
+
+
+def remove_author(user, author):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def trim(user):
+    """Оставляет в ленте не более `TIMELINE_LENGTH` последних записей."""
+    stale = TimelineEntry.objects.filter(user=user).order_by(
+        '-pub_date', '-post'
+    ).values_list('pk', flat=True)[settings.TIMELINE_LENGTH:]
+    stale = list(stale)
+    if stale:
+        TimelineEntry.objects.filter(pk__in=stale).delete()
+
+
+def overflowing(users):
+    """Пользователи из `users`, чьи ленты длиннее `TIMELINE_LENGTH`.
+
+    Подсчёт идёт по индексу (user, post) без сортировки записей.
+    """
+    return list(
+        TimelineEntry.objects.filter(user__in=users).values('user')
+        .annotate(total=Count('pk'))
+        .filter(total__gt=settings.TIMELINE_LENGTH)
+        .values_list('user', flat=True)
+        .order_by()
+    )
+
+
+def trim_many(users):
+    """`trim` для многих лент: один запрос на пачку пользователей.
+
+    Удаление с нумерацией записей идёт только по лентам, которые
+    действительно длиннее `TIMELINE_LENGTH`.
+    """
+    table = TimelineEntry._meta.db_table
+    for start in range(0, len(users), BATCH_SIZE):
+        batch = overflowing(users[start:start + BATCH_SIZE])
+        if not batch:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN ('
+                ' SELECT id FROM ('
+                '  SELECT id, ROW_NUMBER() OVER ('
+                '   PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC'
+                f'  ) AS position FROM {table}'
+                f'  WHERE user_id IN ({", ".join(["%s"] * len(batch))})'
+                ' ) AS ranked WHERE position > %s'
+                ')',
+                [*batch, settings.TIMELINE_LENGTH],
+            )
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя с нуля."""
+    posts = Post.objects.filter(
+        author__following__user=user_id
+    ).exclude(
+        author__in=celebrity_authors()
+    ).order_by('-pub_date').values_list('pk', 'pub_date')
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user=user_id).delete()
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for pk, pub_date in posts[:settings.TIMELINE_LENGTH]
+            ),
+            batch_size=BATCH_SIZE,
+        )
@@ -14,6 +14,8 @@ urlpatterns = [
     path(
         'posts/<int:post_id>/comment/', views.add_comment, name='add_comment'
     ),
+    path('search/', views.search, name='search'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('follow/', views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
@@ -1,33 +1,37 @@
+from urllib.parse import urlencode
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from core.uploads import limit_uploads
+
+from . import autocomplete as post_autocomplete
+from . import search as post_search
+from . import stats, thumbnails, timeline
+from .cache import AUTHOR, FEED, GROUP, cache_feed
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
+from .models import Follow, Group, Post, User
+from .paginator import paginate
 
 
-@cache_page(20)
+@cache_feed(FEED)
 def index(request):
     posts = Post.objects.select_related('author', 'group').all()
-    paginator = Paginator(posts, settings.OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    comment = Comment.objects.all().last()
+    page_obj = paginate(request, posts)
     context = {
         'page_obj': page_obj,
-        'comment': comment,
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache_feed(GROUP.format('{slug}'))
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    group_posts = group.posts.all()
-    paginator = Paginator(group_posts, settings.OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group_posts = group.posts.select_related('author', 'group')
+    page_obj = paginate(request, group_posts)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -35,35 +39,74 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_feed(AUTHOR.format('{username}'))
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    post_number = author.posts.all()
-    paginator = Paginator(post_number, settings.OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = request.user
-    if following.is_authenticated:
-        following = author.following.filter(user=request.user).exists()
+    post_number = author.posts.select_related('author', 'group')
+    page_obj = paginate(request, post_number)
     context = {
-        'following': following,
         'author': author,
+        'author_stats': stats.get_stats(author.pk),
         'page_obj': page_obj,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    filters = {
+        'group': request.GET.get('group', ''),
+        'author': request.GET.get('author', '').strip(),
+    }
+    match = post_search.match_query(query)
+    page_obj = None
+    if match:
+        posts = Post.objects.select_related('author', 'group')
+        if filters['group']:
+            posts = posts.filter(group__slug=filters['group'])
+        if filters['author']:
+            posts = posts.filter(author__username=filters['author'])
+        paginator = post_search.SearchPaginator(
+            post_search.search(match, posts), settings.OBJECTS_PER_PAGE
+        )
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+    context = {
+        'query': query,
+        'filters': filters,
+        'groups': Group.objects.order_by('title'),
+        'page_obj': page_obj,
+        'query_string': urlencode(
+            {'q': query, **{k: v for k, v in filters.items() if v}}
+        ),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def autocomplete(request):
+    try:
+        limit = max(min(int(request.GET.get('limit', 0)), 50), 0)
+    except ValueError:
+        limit = 0
+    results = post_autocomplete.complete(request.GET.get('q', ''), limit)
+    return JsonResponse({'results': results})
+
+
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = post.comments.select_related('author')
     context = {
         'post': post,
+        'author_stats': stats.get_stats(post.author_id),
         'form': form,
         'comments': comments,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@limit_uploads
 @login_required
 def post_create(request):
     author = request.user
@@ -74,7 +117,9 @@ def post_create(request):
     if form.is_valid():
         new_post = form.save(commit=False)
         new_post.author = author
-        new_post.save()
+        with transaction.atomic():
+            new_post.save()
+            thumbnails.enqueue(new_post.image.name)
         return redirect('posts:profile', author.username)
     return render(
         request, 'posts/create_post.html',
@@ -82,10 +127,11 @@ def post_create(request):
     )
 
 
+@limit_uploads
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
-    if request.user != post.author:
+    if request.user.pk != post.author_id:
         return redirect('posts:post_detail', post_id)
     form = PostForm(
         request.POST or None,
@@ -93,7 +139,10 @@ def post_edit(request, post_id):
         instance=post
     )
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            post = form.save()
+            if 'image' in form.changed_data:
+                thumbnails.enqueue(post.image.name)
         return redirect('posts:post_detail', post_id)
     context = {
         'post': post,
@@ -112,18 +161,15 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user
-    )
-    paginator = Paginator(posts, settings.OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts, cursor_paginator = timeline.timeline_posts(request.user)
+    page_obj = paginate(request, posts, cursor_paginator)
     context = {
         'page_obj': page_obj,
     }
@@ -134,14 +180,14 @@ def follow_index(request):
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        with transaction.atomic():
+            Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', author)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(user=request.user, author=author)
-    if follow.exists():
-        follow.delete()
+    with transaction.atomic():
+        Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('posts:profile', username=username)
@@ -20,6 +20,13 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 OBJECTS_PER_PAGE = 10
+# Листать ленты по курсору (pub_date, id) вместо номеров страниц.
+POSTS_CURSOR_PAGINATION = False
+# Сколько последних постов хранится в ленте подписок пользователя.
+TIMELINE_LENGTH = 1000
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а подмешиваются при чтении.
+TIMELINE_FANOUT_LIMIT = 5000
 
 DEBUG = True
 
@@ -48,6 +55,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.queries.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -126,9 +134,97 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы из MEDIA_ROOT отдаёт core.media.serve. За nginx или Apache
+# отдачу лучше переложить на них: 'x-accel-redirect' (nginx, internal
+# location с адресом MEDIA_ACCEL_PREFIX) или 'x-sendfile' (Apache).
+MEDIA_ACCEL = os.getenv('MEDIA_ACCEL') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Срок кэширования в браузере; имена по содержимому не меняются никогда.
+MEDIA_MAX_AGE = 60 * 60
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Загрузки в формах постов (core.uploads.limit_uploads) пишутся на диск и
+# обрываются на MAX_UPLOAD_SIZE; картинки проверяются по заголовку и
+# уменьшаются до MAX_IMAGE_SIDE.
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 24_000_000
+MAX_IMAGE_SIDE = 2560
+
+# Страницы лент сбрасываются сигналами, сроки хранения — страховочные.
+# После мягкого срока страница пересчитывается одним запросом, остальные
+# до жёсткого срока получают прежнюю копию.
+FEED_CACHE_SOFT_TIMEOUT = 60 * 10
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+FEED_CACHE_LOCK_TIMEOUT = 10
+# Коэффициент вероятностного раннего обновления (0 — отключить).
+FEED_CACHE_BETA = 1.0
+# Карточки постов меняют ключ при правке, срок хранения — страховочный.
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Число SQL-запросов на страницу (см. core.queries). Проверка обходит стек
+# на каждом SQL-запросе, поэтому выключена; при разработке её включает
+# переменная окружения QUERY_BUDGET (нарушения пишутся в журнал), тесты —
+# через override_settings вместе с QUERY_BUDGET_RAISE.
+QUERY_BUDGET_ENABLED = bool(os.getenv('QUERY_BUDGET'))
+QUERY_BUDGET_RAISE = False
+# Первый показ картинки создаёт миниатюры и записи sorl, это до десятка
+# запросов сверх обычных; страницам с особым бюджетом — свой в QUERY_BUDGETS
+# по имени view, например {'posts:post_create': 25}.
+QUERY_BUDGET_DEFAULT = 20
+QUERY_BUDGETS = {}
+# Столько одинаковых SELECT'ов на странице считаются N+1.
+QUERY_REPEAT_THRESHOLD = 3
+# Таблицы, повторные чтения которых ожидаемы: sorl перечитывает своё
+# хранилище, когда впервые делает миниатюру прямо в шаблоне.
+QUERY_REPEAT_IGNORE = ('"thumbnail_kvstore"',)
+
+# Подсказки авторов и групп держатся в памяти процесса; изменения из
+# других процессов подхватываются не реже, чем раз в столько секунд.
+AUTOCOMPLETE_CHECK_INTERVAL = 5
+AUTOCOMPLETE_LIMIT = 10
+
+# Микробенчмарки (команда benchmark): засеянные базы разных размеров и
+# базовые замеры лежат в BENCHMARK_DIR. Замедлением считается рост
+# медианы больше BENCHMARK_THRESHOLD при значимости BENCHMARK_ALPHA.
+BENCHMARK_DIR = os.path.join(BASE_DIR, 'benchmarks')
+BENCHMARK_SIZES = {
+    'small': {
+        'users': 200, 'groups': 10, 'posts': 2000, 'comments': 4000,
+        'follows': 2000,
+    },
+    'medium': {
+        'users': 2000, 'groups': 50, 'posts': 50000, 'comments': 100000,
+        'follows': 40000,
+    },
+    'large': {
+        'users': 20000, 'groups': 200, 'posts': 500000,
+        'comments': 1000000, 'follows': 400000,
+    },
+}
+BENCHMARK_THRESHOLD = 0.2
+BENCHMARK_ALPHA = 0.01
+
+# Миниатюры новых картинок готовятся в фоне пулом из стольких потоков;
+# THUMBNAIL_PREGENERATE=0 в окружении оставляет их до первого показа.
+# Тесты выключают подготовку в core.testing.
+THUMBNAIL_PREGENERATE = os.getenv('THUMBNAIL_PREGENERATE', '1') != '0'
+THUMBNAIL_WORKERS = 2
+# Миниатюры без EXIF, варианты WebP и AVIF для srcset карточек.
+THUMBNAIL_ENGINE = 'posts.imaging.Engine'
+THUMBNAIL_BACKEND = 'posts.imaging.Backend'
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_BYTES': 256 * 1024 * 1024,
+        },
     }
 }
+
+# Тесты идут со своими CACHES и THUMBNAIL_PREGENERATE (core.testing):
+# manage.py test — через TEST_RUNNER, pytest — через корневой conftest.py.
+TEST_RUNNER = 'core.testing.TestRunner'